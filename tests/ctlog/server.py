@@ -0,0 +1,58 @@
+"""Stand-in for the certspotter issuances API used by the tests.
+
+Serves the issuances from a JSON file, filtered by domain (including
+subdomains) and paginated with `after`. The first request for each
+domain is rejected with status 429 and a Retry-After header to test
+the client's backoff.
+
+"""
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PAGE_SIZE = 2
+
+
+class IssuancesHandler(BaseHTTPRequestHandler):
+    issuances = []
+    throttled = set()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path != "/v1/issuances" or "domain" not in query:
+            self.send_error(404)
+            return
+
+        domain = query["domain"][0]
+        if domain not in self.throttled:
+            self.throttled.add(domain)
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+
+        after = int(query.get("after", ["0"])[0])
+        matching = [
+            issuance
+            for issuance in self.issuances
+            if int(issuance["id"]) > after
+            and any(
+                name.rstrip(".").lower() == domain
+                or name.rstrip(".").lower().endswith(f".{domain}")
+                for name in issuance["dns_names"]
+            )
+        ]
+        body = json.dumps(matching[:PAGE_SIZE]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f:
+        IssuancesHandler.issuances = json.load(f)
+    HTTPServer(("", 8080), IssuancesHandler).serve_forever()
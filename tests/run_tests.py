@@ -35,6 +35,12 @@ def run():
     RunTests = type("RunTests", (RunTestsBase,), test_cases)
 
     suite = unittest.defaultTestLoader.loadTestsFromTestCase(RunTests)
+    # unit tests of the core data structures (tests/test_*.py)
+    suite.addTests(
+        unittest.defaultTestLoader.discover(
+            "tests", pattern="test_*.py", top_level_dir="."
+        )
+    )
     test_runner = unittest.TextTestRunner().run(suite)
     if len(test_runner.errors) > 0:
         sys.exit(-1)
@@ -0,0 +1,54 @@
+import unittest
+
+from yesses.domaintrie import DomainTrie
+
+
+class DomainTrieTest(unittest.TestCase):
+    def setUp(self):
+        self.trie = DomainTrie(
+            ["example.com", "WWW.example.com.", "*.api.example.com", "other.net"]
+        )
+
+    def test_normalized_names(self):
+        self.assertEqual(len(self.trie), 4)
+        self.assertIn("www.example.com", self.trie)
+        self.assertIn("Example.COM.", self.trie)
+        self.assertNotIn("com", self.trie)
+        self.assertNotIn("test.example.com", self.trie)
+        self.trie.add("www.EXAMPLE.com")
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(
+            sorted(self.trie),
+            ["*.api.example.com", "example.com", "other.net", "www.example.com"],
+        )
+
+    def test_wildcards(self):
+        self.assertTrue(self.trie.matches("v1.api.example.com"))
+        self.assertTrue(self.trie.matches("*.api.example.com"))
+        self.assertFalse(self.trie.matches("api.example.com"))
+        self.assertFalse(self.trie.matches("a.v1.api.example.com"))
+        self.assertTrue(self.trie.matches("www.example.com"))
+        self.assertFalse(self.trie.matches("mail.example.com"))
+
+    def test_parents(self):
+        self.assertEqual(
+            list(self.trie.parents("a.www.example.com")),
+            ["www.example.com", "example.com"],
+        )
+        self.assertEqual(list(self.trie.parents("example.com")), [])
+        self.assertTrue(self.trie.has_parent("mail.example.com"))
+        self.assertFalse(self.trie.has_parent("example.org"))
+        self.assertEqual(
+            list(self.trie.relative_names("a.www.example.com")), ["a", "a.www"]
+        )
+
+    def test_subdomains(self):
+        self.assertEqual(
+            sorted(self.trie.subdomains("example.com")),
+            ["*.api.example.com", "www.example.com"],
+        )
+        self.assertEqual(list(self.trie.subdomains("example.org")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+from yesses.findingschannel import FindingsChannel
+
+
+class SmallChannel(FindingsChannel):
+    MAX_BUFFERED = 2
+
+
+class FindingsChannelTest(unittest.TestCase):
+    def test_order_and_dedupe(self):
+        channel = FindingsChannel([{"ip": "a"}, {"ip": "b"}, {"ip": "a"}], 2)
+        channel.put({"ip": "b"})
+        channel.put({"ip": "c"})
+        channel.finish()
+        channel.put({"ip": "c"})
+        channel.put({"ip": "d"})
+        channel.finish()
+        expected = [{"ip": "a"}, {"ip": "b"}, {"ip": "a"}, {"ip": "c"}, {"ip": "d"}]
+        self.assertEqual(list(channel), expected)
+        # a second iteration yields the same findings
+        self.assertEqual(list(channel), expected)
+
+    def test_required_keys(self):
+        channel = FindingsChannel([], 1, required_keys=["ip"])
+        channel.put({"domain": "example.com"})
+        channel.finish()
+        with self.assertRaises(Exception):
+            list(channel)
+
+    def test_backpressure(self):
+        channel = SmallChannel([], 1)
+        produced = []
+
+        def produce():
+            for i in range(5):
+                channel.put({"n": i})
+                produced.append(i)
+            channel.finish()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        producer.join(0.5)
+        # the producer blocks on the third finding
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(produced, [0, 1])
+
+        self.assertEqual([f["n"] for f in channel], [0, 1, 2, 3, 4])
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+
+    def test_close(self):
+        channel = SmallChannel([], 1)
+        channel.put({"n": 0})
+        channel.put({"n": 1})
+        producer = threading.Thread(target=channel.put, args=({"n": 2},))
+        producer.start()
+        producer.join(0.5)
+        self.assertTrue(producer.is_alive())
+
+        channel.close()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        # findings put after closing are discarded without blocking
+        for i in range(3, 10):
+            channel.put({"n": i})
+
+
+if __name__ == "__main__":
+    unittest.main()
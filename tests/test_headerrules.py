@@ -0,0 +1,85 @@
+import unittest
+
+from yesses.headerrules import HeaderExpression, HeaderRuleSet
+
+
+class HeaderExpressionTest(unittest.TestCase):
+    def test_allowed(self):
+        hsts = HeaderExpression("max_age >= 31536000")
+        self.assertTrue(hsts.evaluate("max-age=31536000; includeSubDomains"))
+        self.assertFalse(hsts.evaluate("max-age=300"))
+        self.assertFalse(hsts.evaluate("includeSubDomains"))
+
+        expect_ct = HeaderExpression('value.startswith("enforce,") and max_age > 86400')
+        self.assertTrue(expect_ct.evaluate("enforce, max-age=86401"))
+        self.assertFalse(expect_ct.evaluate("max-age=86401"))
+
+        self.assertTrue(HeaderExpression("len(value) > 3").evaluate("abcd"))
+        self.assertTrue(HeaderExpression("int(value) + 1 == 3").evaluate("2"))
+        self.assertTrue(HeaderExpression("not -max_age").evaluate(""))
+
+    def test_rejected(self):
+        for expression in [
+            "__import__('os')",
+            "open('/etc/passwd')",
+            "value.__class__",
+            "value._private",
+            "(lambda: 1)()",
+            "value[0]",
+            "[c for c in value]",
+            "{value}",
+            "(x := 1)",
+        ]:
+            with self.subTest(expression=expression):
+                with self.assertRaises(Exception):
+                    HeaderExpression(expression)
+
+
+class HeaderRuleSetTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = HeaderRuleSet(
+            [
+                {"header": "X-Frame-Options", "value": "deny"},
+                {"header": "X-.*"},
+                {"header": "Strict-Transport-Security", "value_expr": "max_age > 0"},
+                {"header": "Server", "value": ".*[0-9].*", "origin": "https://a\\."},
+            ]
+        )
+
+    def test_match(self):
+        headers = [
+            ("Server", "nginx/1.2"),
+            ("x-powered-by", "PHP"),
+            ("X-Frame-Options", "DENY "),
+            ("Strict-Transport-Security", "max-age=0"),
+        ]
+        matches = [
+            (self.rules.rules.index(rule), header)
+            for rule, header, _ in self.rules.match(headers)
+        ]
+        # ordered by rule, then by header
+        self.assertEqual(
+            matches,
+            [
+                (0, "X-Frame-Options"),
+                (1, "x-powered-by"),
+                (1, "X-Frame-Options"),
+                (3, "Server"),
+            ],
+        )
+
+    def test_origin(self):
+        headers = [("Server", "nginx/1.2")]
+        self.assertEqual(len(self.rules.match(headers, "https://a.example")), 1)
+        self.assertEqual(self.rules.match(headers, "https://b.example"), [])
+
+    def test_missing(self):
+        headers = [("Strict-Transport-Security", "max-age=600")]
+        missing = self.rules.missing(headers, "https://b.example")
+        self.assertEqual([self.rules.rules.index(rule) for rule in missing], [0, 1])
+        missing = self.rules.missing(headers, "https://a.example")
+        self.assertEqual([self.rules.rules.index(rule) for rule in missing], [0, 1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import yaml
+
+from yesses.headers import Headers
+
+
+class HeadersTest(unittest.TestCase):
+    PAIRS = [
+        ("Content-Type", "text/html"),
+        ("Set-Cookie", "a=1; Secure"),
+        ("Vary", "Accept"),
+        ("set-cookie", "b=2; HttpOnly"),
+        ("vary", "Cookie"),
+    ]
+
+    def test_repeated_headers(self):
+        headers = Headers(self.PAIRS)
+        self.assertEqual(headers.items(), self.PAIRS)
+        self.assertEqual(
+            headers.get_all("SET-COOKIE"), ["a=1; Secure", "b=2; HttpOnly"]
+        )
+        self.assertEqual(headers.get("Vary"), "Accept, Cookie")
+        self.assertIsNone(headers.get("Server"))
+
+    def test_lines(self):
+        headers = Headers(self.PAIRS)
+        self.assertEqual(
+            list(headers),
+            [
+                "Content-Type: text/html",
+                "Set-Cookie: a=1; Secure",
+                "Vary: Accept, Cookie",
+                "set-cookie: b=2; HttpOnly",
+            ],
+        )
+        self.assertEqual(len(headers), 4)
+        self.assertEqual(headers, list(headers))
+
+    def test_from_lines(self):
+        headers = Headers.from_lines(["Server: nginx", "X-Test:  a: b "])
+        self.assertEqual(headers.items(), [("Server", "nginx"), ("X-Test", "a: b")])
+
+    def test_shared_instances(self):
+        self.assertIs(Headers(self.PAIRS), Headers(list(self.PAIRS)))
+
+    def test_cookies(self):
+        headers = Headers(self.PAIRS)
+        self.assertEqual(
+            headers.cookies(), [("a", {"secure": ""}), ("b", {"httponly": ""})]
+        )
+
+    def test_yaml_round_trip(self):
+        headers = Headers(self.PAIRS)
+        text = yaml.dump({"page": headers, "other": headers})
+        self.assertIn(Headers.YAML_TAG, text)
+        # written once, referenced by an alias
+        self.assertEqual(text.count("Content-Type"), 1)
+        loaded = yaml.full_load(text)
+        self.assertIsInstance(loaded["page"], Headers)
+        self.assertEqual(loaded["page"].items(), self.PAIRS)
+        self.assertIs(loaded["page"], loaded["other"])
+
+    def test_safe_dump(self):
+        headers = Headers(self.PAIRS)
+        self.assertEqual(yaml.safe_load(yaml.safe_dump(headers)), headers.lines)
+
+    def test_updated(self):
+        stored = Headers(
+            [
+                ("Date", "Mon, 01 Jun 2020 10:00:00 GMT"),
+                ("Content-Length", "2"),
+                ("ETag", '"v1"'),
+            ]
+        )
+        fresh = Headers(
+            [
+                ("date", "Tue, 02 Jun 2020 10:00:00 GMT"),
+                ("Content-Length", "0"),
+                ("X-New", "1"),
+            ]
+        )
+        self.assertEqual(
+            stored.updated(fresh).items(),
+            [
+                ("date", "Tue, 02 Jun 2020 10:00:00 GMT"),
+                ("Content-Length", "2"),
+                ("ETag", '"v1"'),
+                ("X-New", "1"),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from yesses.iprange import IPRangeIndex, expand_ip_entries, expand_ips
+
+
+class IPRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.index = IPRangeIndex(
+            ["192.0.2.0/25", "192.0.2.128/25", "198.51.100.7", "2001:db8::/64"]
+        )
+
+    def test_addresses(self):
+        self.assertIn("192.0.2.1", self.index)
+        self.assertIn("192.0.2.255", self.index)
+        self.assertIn("198.51.100.7", self.index)
+        self.assertNotIn("198.51.100.8", self.index)
+        self.assertIn("2001:db8::1", self.index)
+        self.assertNotIn("2001:db8:1::1", self.index)
+
+    def test_ranges(self):
+        # adjacent ranges are merged
+        self.assertIn("192.0.2.0/24", self.index)
+        self.assertIn("192.0.2.64/26", self.index)
+        self.assertNotIn("192.0.0.0/16", self.index)
+        self.assertIn("2001:db8::/96", self.index)
+        self.assertEqual(len(IPRangeIndex(["192.0.2.0/24", "192.0.2.1"])), 256)
+
+    def test_other_values(self):
+        self.assertNotIn("example.com", self.index)
+        self.assertFalse(IPRangeIndex.is_valid("example.com"))
+        self.assertTrue(IPRangeIndex.is_valid("192.0.2.0/24"))
+        self.assertTrue(IPRangeIndex.is_valid("2001:db8::1"))
+
+    def test_expand(self):
+        self.assertEqual(
+            list(expand_ips(["192.0.2.0/30", "198.51.100.7/32", "example.com"])),
+            ["192.0.2.1", "192.0.2.2", "198.51.100.7", "example.com"],
+        )
+        self.assertEqual(
+            list(expand_ip_entries([{"ip": "192.0.2.4/31", "port": 80}])),
+            [{"ip": "192.0.2.4", "port": 80}, {"ip": "192.0.2.5", "port": 80}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
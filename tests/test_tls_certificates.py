@@ -0,0 +1,79 @@
+import unittest
+
+from yesses.cache import Cache, activate, active_cache
+from yesses.discover.tls_certificates import TLSCertificates
+
+
+class FakeLog:
+    """Serves certspotter-like pages of two issuances."""
+
+    def __init__(self):
+        self.issuances = []
+        self.cursors = []
+
+    def add(self, *names):
+        self.issuances.append(
+            {
+                "id": str(len(self.issuances) + 1),
+                "dns_names": list(names),
+                "pubkey_sha256": f"key{len(self.issuances) + 1}",
+            }
+        )
+
+    def fetch_page(self, query_domain, cursor):
+        self.cursors.append(cursor)
+        start = 0 if cursor is None else int(cursor)
+        return self.issuances[start : start + 2]
+
+
+class TLSCertificatesTest(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = active_cache()
+        activate(Cache())
+        self.log = FakeLog()
+        self.log.add("example.com", "www.example.com")
+        self.log.add("mail.example.com")
+        self.log.add("*.api.example.com")
+
+    def tearDown(self):
+        activate(self.previous_cache)
+
+    def scan(self, **kwargs):
+        module = TLSCertificates(None, seeds=[{"domain": "example.com"}], **kwargs)
+        module.fetch_page = self.log.fetch_page
+        module.run()
+        return (
+            sorted(r["domain"] for r in module.results["TLS-Names"]),
+            sorted(r["pubkey"] for r in module.results["TLS-Certificates"]),
+        )
+
+    def test_incremental(self):
+        names, keys = self.scan()
+        self.assertEqual(self.log.cursors, [None, "2", "3"])
+        self.assertEqual(keys, ["key1", "key2", "key3"])
+
+        self.log.cursors = []
+        self.log.add("new.example.com")
+        new_names, new_keys = self.scan()
+        # only certificates after the stored cursor are fetched
+        self.assertEqual(self.log.cursors, ["3", "4"])
+        self.assertEqual(new_names, sorted(names + ["new.example.com"]))
+        self.assertEqual(new_keys, ["key1", "key2", "key3", "key4"])
+
+    def test_full_fetch(self):
+        self.scan()
+        self.log.cursors = []
+        self.scan(incremental=False)
+        self.assertEqual(self.log.cursors, [None, "2", "3"])
+
+    def test_cache_ttl(self):
+        self.scan(cache_ttl=0)
+        self.log.cursors = []
+        names, _ = self.scan(cache_ttl=0)
+        # the stored state has expired
+        self.assertEqual(self.log.cursors, [None, "2", "3"])
+        self.assertIn("*.api.example.com", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import threading
+import time
+import logging
+
+log = logging.getLogger("cache")
+
+
+class Cache:
+    """Data that is shared between the steps of a run and, optionally,
+    between runs.
+
+    Entries stored with set() belong to a namespace and expire after
+    their time to live. If the cache was created with a State object,
+    the entries are loaded from and saved to the respective file.
+
+    Objects registered with shared() (e.g., the reachability cache)
+    are kept in memory for the duration of the run only.
+
+    """
+
+    def __init__(self, state=None, settings=None):
+        self.state = state
+        self.settings = settings or {}
+        self.data = {}
+        self.shared_objects = {}
+        self.lock = threading.RLock()
+
+    def load(self):
+        if self.state is None:
+            return
+        self.state.load()
+        self.data = self.state.data or {}
+        self.prune()
+
+    def save(self):
+        if self.state is None:
+            return
+        with self.lock:
+            self.prune()
+            self.state.data = {
+                namespace: {
+                    key: entry
+                    for key, entry in entries.items()
+                    if not entry.get("transient", False)
+                }
+                for namespace, entries in self.data.items()
+            }
+            self.state.save()
+
+    def is_persistent(self):
+        """Whether the entries are saved for subsequent runs."""
+        return self.state is not None
+
+    def setting(self, name, default=None):
+        return self.settings.get(name, default)
+
+    def get(self, namespace, key, default=None):
+        with self.lock:
+            entry = self.data.get(namespace, {}).get(key)
+            if entry is None or self.is_expired(entry):
+                return default
+            return entry["value"]
+
+    def set(self, namespace, key, value, ttl=None, transient=False):
+        """Store a value. Values without ttl do not expire. Transient
+        values are not written to the cache file.
+
+        """
+        entry = {"value": value, "expires": None if ttl is None else time.time() + ttl}
+        if transient:
+            entry["transient"] = True
+        with self.lock:
+            self.data.setdefault(namespace, {})[key] = entry
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace):
+        with self.lock:
+            return [
+                (key, entry["value"])
+                for key, entry in self.data.get(namespace, {}).items()
+                if not self.is_expired(entry)
+            ]
+
+    def prune(self):
+        with self.lock:
+            for namespace, entries in self.data.items():
+                expired = [k for k, e in entries.items() if self.is_expired(e)]
+                for key in expired:
+                    del entries[key]
+                if expired:
+                    log.debug(
+                        f"Removed {len(expired)} expired entries from {namespace}"
+                    )
+
+    @staticmethod
+    def is_expired(entry):
+        return entry["expires"] is not None and entry["expires"] < time.time()
+
+    def shared(self, name, factory):
+        """Return the run-wide object registered under `name`, creating it
+        with factory(cache) if it does not exist yet.
+
+        """
+        with self.lock:
+            if name not in self.shared_objects:
+                self.shared_objects[name] = factory(self)
+            return self.shared_objects[name]
+
+    def close(self):
+        """Release the run-wide objects registered with shared() that
+        have a close() method (e.g., threads and temporary files)."""
+        with self.lock:
+            shared_objects = list(self.shared_objects.values())
+            self.shared_objects = {}
+        for obj in shared_objects:
+            if hasattr(obj, "close"):
+                obj.close()
+
+
+# The cache of the current run. Modules that are run without a
+# configuration file (e.g., from the command line) use an in-memory
+# cache.
+_active_cache = Cache()
+
+
+def active_cache():
+    return _active_cache
+
+
+def activate(cache):
+    global _active_cache
+    _active_cache = cache
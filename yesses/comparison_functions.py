@@ -39,7 +39,7 @@ def get_function_in_expr(rule, quantifier, list1, list2, severity):
             yield Alert(
                 severity=severity,
                 violated_rule=rule,
-                findings={"extra items": items_from_1_in_2},
+                findings={"extra items": common_items},
                 step=step,
             )
 
@@ -4,12 +4,15 @@ from .findingslist import FindingsList
 from .alertslist import AlertsList
 from .step import Step, StepOutput, GlobalFindingsStepInput
 from .output import Output
+from .state import State
+from .cache import Cache
 
 
 class Config:
     STATE_SUFFIX = ".state"
     RESUME_SUFFIX = ".resume"
     ALERTS_SUFFIX = ".alerts"
+    CACHE_SUFFIX = ".cache"
 
     def __init__(self, configfile, fresh=False):
         self.raw_config = configfile.read()
@@ -42,6 +45,13 @@ class Config:
             self.configfilepath.with_suffix(self.ALERTS_SUFFIX), fresh
         )
 
+        cache_settings = self.data.get("cache", {})
+        if cache_settings.get("persist", False):
+            cache_state = State(self.configfilepath.with_suffix(self.CACHE_SUFFIX), fresh)
+        else:
+            cache_state = None
+        self.cache = Cache(cache_state, cache_settings)
+
     def load_resume(self, step=None):
         skip_to = self.findingslist.load_resume(step)
         skip_to_2 = self.alertslist.load_resume(step)
@@ -59,6 +69,7 @@ class Config:
 
     def save_persist(self):
         self.findingslist.save_persist()
+        self.cache.save()
 
     def validate(self):
         provided_keys_in_global_findingslist = {}
@@ -70,11 +81,16 @@ class Config:
 
             provided_keys_in_global_findingslist[name] = provided_keys
 
+        running_steps = []
         for step in self.steps:
+            # steps with 'stream: true' run at the same time as the steps before
+            if not step.stream:
+                running_steps = []
             try:
                 # First, validate the inputs
                 for name, input in step.inputs.items():
                     input.check_has_keys(provided_keys_in_global_findingslist)
+                step.validate_streaming(running_steps)
 
                 # Finds are already validated when creating the steps
                 # Validate expects
@@ -84,5 +100,6 @@ class Config:
                     provided_keys_in_global_findingslist[
                         output.alias
                     ] = output.provided_keys
+                running_steps.append(step)
             except Exception as e:
                 raise Exception(f"Error validating step {step}.")
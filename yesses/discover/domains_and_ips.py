@@ -1,8 +1,12 @@
 import logging
+import itertools
+import threading
 import dns.resolver
 import dns.rdtypes.IN.A
 import dns.rdtypes.IN.AAAA
 from yesses.module import YModule, YExample
+from yesses.dnscache import get_dns_cache
+from yesses.domaintrie import DomainTrie
 
 log = logging.getLogger("discover/domains_and_ips")
 
@@ -12,6 +16,9 @@ class DomainsAndIPs(YModule):
 guessing expansions for wildcards and expanding CNAMEs. Finds IP
 addresses from A and AAAA records.
 
+Answers to DNS queries are cached for their TTL and shared between all
+steps of a run (see the `cache` section of the configuration).
+
 This example expands domains from a list of domain seeds and the TLS names found with `discover TLS Certificates`. The alerting assumes that a whitelist of IP addresses (`Good-IPs`) exists.
 ```
   - discover Domains and IPs:
@@ -62,6 +69,16 @@ run:
             "unwrap": True,
             "default": [],
         },
+        "timeout": {
+            "required_keys": None,
+            "description": "Time in seconds to wait for the answer to a DNS query.",
+            "default": 5,
+        },
+        "parallel_requests": {
+            "required_keys": None,
+            "description": "Number of DNS queries to run in parallel.",
+            "default": 20,
+        },
     }
 
     OUTPUTS = {
@@ -100,55 +117,129 @@ run:
     rdtypes = [1, 28]  # A and AAAA
 
     def run(self):
-        self.resolver = dns.resolver.Resolver()
-        if self.resolvers != []:
-            self.resolver.nameservers = self.resolvers
+        self.create_resolvers()
 
         self.domains = set(self.seeds)
+        self.seed_trie = DomainTrie(self.seeds)
         self.ignored_domains = set()
         log.info(f"Domains before expanding: {self.domains}")
-        self.expand_from_cnames()
-        log.info(f"Found {len(self.domains)} domains after expanding CNAMEs")
-        self.expand_wildcards()
-        log.info(f"Found {len(self.domains)} domains after expanding wildcards")
-        self.ips_from_domains()
+        self.executor = self.thread_pool(self.parallel_requests)
+        with self.executor:
+            self.expand_from_cnames()
+            log.info(f"Found {len(self.domains)} domains after expanding CNAMEs")
+            self.expand_wildcards()
+            log.info(f"Found {len(self.domains)} domains after expanding wildcards")
+            self.ips_from_domains()
         log.info(f"Left with {len(self.domains)} domains after checking for records")
 
+    def create_resolvers(self):
+        """Create one resolver per configured DNS server. Queries are
+        distributed round-robin over the resolvers; each resolver
+        uses the other servers as fallbacks.
+
+        """
+        nameservers = self.resolvers
+        if nameservers == []:
+            nameservers = dns.resolver.Resolver().nameservers
+
+        resolvers = []
+        for i in range(len(nameservers)):
+            resolver = dns.resolver.Resolver()
+            resolver.nameservers = nameservers[i:] + nameservers[:i]
+            resolver.lifetime = self.timeout
+            resolvers.append(resolver)
+
+        self.resolver_cycle = itertools.cycle(resolvers)
+        self.resolver_lock = threading.Lock()
+
+    def query(self, domain, rdtype):
+        with self.resolver_lock:
+            resolver = next(self.resolver_cycle)
+        return get_dns_cache().query(resolver, domain, rdtype)
+
+    def query_cname(self, domain):
+        try:
+            return self.query(domain, "CNAME")
+        except (
+            dns.resolver.NoAnswer,
+            dns.resolver.NXDOMAIN,
+            dns.resolver.NoNameservers,
+        ):
+            return None
+
+    def query_address(self, domain, rdtype):
+        log.debug(f"Checking DNS: {rdtype} {domain}")
+        try:
+            return self.query(domain, rdtype)
+        except (
+            dns.resolver.NXDOMAIN,
+            dns.resolver.NoNameservers,
+            dns.resolver.NoAnswer,
+        ) as e:
+            log.debug(f"Not found: {e}")
+            return None
+
     def expand_from_cnames(self):
-        newdomains = set()
+        """Follow CNAME chains until no new domains are found. Each level
+        of the chains is resolved concurrently. Every domain is queried
+        at most once, so chains sharing a tail (e.g., many domains
+        pointing to the same CDN name) resolve the tail only once and
+        CNAME loops terminate.
 
-        for d in self.domains:
-            if d.startswith("*"):
-                continue
-            try:
-                answers = self.resolver.query(d, "CNAME")
-            except (
-                dns.resolver.NoAnswer,
-                dns.resolver.NXDOMAIN,
-                dns.resolver.NoNameservers,
-            ):
-                continue
+        """
+        self.cnames = {}  # memo: domain -> list of CNAME targets
+        frontier = {d for d in self.domains if not d.startswith("*")}
+        depth = 0
 
-            for rdata in answers:
-                candidate = rdata.target.to_text()[:-1]
-                for s in self.seeds:
-                    if candidate.endswith(f".{s}"):
-                        newdomains.add(candidate)
-                        break
-                else:
-                    self.ignored_domains |= set(candidate)
+        while frontier:
+            depth += 1
+            log.debug(f"Resolving {len(frontier)} CNAMEs on level {depth}")
+            level = sorted(frontier)
+            frontier = set()
+            for d, answers in zip(level, self.executor.map(self.query_cname, level)):
+                targets = (
+                    []
+                    if answers is None
+                    else [a.target.to_text()[:-1] for a in answers]
+                )
+                self.cnames[d] = targets
+                for candidate in targets:
+                    if candidate in self.cnames or candidate in level:
+                        if self.in_cname_chain(candidate, d):
+                            log.info(f"CNAME loop detected: {d} -> {candidate}")
+                        continue
+                    if self.is_seed_subdomain(candidate):
+                        self.domains.add(candidate)
+                        frontier.add(candidate)
+                    else:
+                        self.ignored_domains.add(candidate)
 
-        self.domains |= newdomains
         self.results["Ignored-Domains"] = [{"domain": d} for d in self.ignored_domains]
 
+    def is_seed_subdomain(self, domain):
+        return self.seed_trie.has_parent(domain)
+
+    def in_cname_chain(self, start, domain):
+        """Return True if domain can be reached by following the known
+        CNAMEs from start."""
+        seen = set()
+        todo = [start]
+        while todo:
+            current = todo.pop()
+            if current == domain:
+                return True
+            if current in seen:
+                continue
+            seen.add(current)
+            todo.extend(self.cnames.get(current, []))
+        return False
+
     def expand_wildcards(self):
         subdomains = set()
         for d in self.domains:
             if d.startswith("*"):
                 continue
-            for s in self.seeds:
-                if d.endswith("." + s):
-                    subdomains.add(d[: -(len(s) + 1)])
+            subdomains.update(self.seed_trie.relative_names(d))
         log.info(f"Found subdomains: {subdomains!r}")
 
         newdomainset = set()
@@ -168,22 +259,17 @@ run:
         ips = []
         domains_to_ips = []
 
-        for d in self.domains:
-            for rdtype in self.rdtypes:
-                log.debug(f"Checking DNS: {rdtype} {d}")
-                try:
-                    answers = self.resolver.query(d, rdtype)
-                except (
-                    dns.resolver.NXDOMAIN,
-                    dns.resolver.NoNameservers,
-                    dns.resolver.NoAnswer,
-                ) as e:
-                    log.debug(f"Not found: {e}")
-                else:
-                    for answer in answers:
-                        domains_to_ips.append({"domain": d, "ip": answer.address})
-                        ips.append(answer.address)
-                    newdomainset.add(d)
+        # A and AAAA queries for all domains are sent at the same time
+        queries = [(d, rdtype) for d in self.domains for rdtype in self.rdtypes]
+        results = self.executor.map(lambda q: self.query_address(*q), queries)
+
+        for (d, rdtype), answers in zip(queries, results):
+            if answers is None:
+                continue
+            for answer in answers:
+                domains_to_ips.append({"domain": d, "ip": answer.address})
+                ips.append(answer.address)
+            newdomainset.add(d)
 
         self.results["Domains"] = [{"domain": d} for d in newdomainset]
         self.results["DNS-Entries"] = domains_to_ips
@@ -1,9 +1,13 @@
+import asyncio
 import requests
+import hashlib
 import logging
+import threading
 from random import randint
 
 from yesses.module import YModule, YExample
 from yesses import utils
+from yesses.hostcontrol import get_host_controller
 
 log = logging.getLogger("discover/error_paths")
 
@@ -12,18 +16,55 @@ class ErrorPaths(YModule):
     """This module tries to provoke errors and saves the error pages in an
     array. The error pages can then be used as the inputs for the
     information leakage module and the header leakage module to search
-    them for too much information. Currently, this module only calls a
-    non-existing page to get a 404 not found error page.
+    them for too much information.
+
+The following probes are sent to each origin (see `probes`):
+
+  * `not-found`: a non-existing page (404 Not Found)
+  * `method-not-allowed`: an unknown request method (405 Method Not Allowed or 501 Not Implemented)
+  * `bad-request`: a path leading outside of the document root (400 Bad Request)
+  * `uri-too-long`: a very long path (414 URI Too Long)
+  * `server-error`: unexpected query parameters (e.g., 500 Internal Server Error)
+
+Only responses with an error status code (400 or higher) are kept.
+If several probes for an origin return the same status code and
+page, only the first one is kept.
+
+Up to `parallel_requests` origins are probed at the same time; the
+probes for one origin share a keep-alive connection. The requests
+also count towards the `async_concurrency` limit of the run.
 
     """
 
     USER_AGENTS_LIST = "assets/user-agents.txt"
+    HTTP_CACHE = False
+
+    PROBES = {
+        "not-found": (
+            "GET",
+            "/yesses-scanner-nonexisting-url/opdvsltqfnlcelh/ddsleo/glcgrfmr.html",
+        ),
+        "method-not-allowed": ("YESSES", "/"),
+        "bad-request": ("GET", "/%2e%2e/%2e%2e/yesses-scanner-bad-request"),
+        "uri-too-long": ("GET", "/yesses-scanner-" + "a" * 16384),
+        "server-error": ("GET", "/?yesses[]=%27%22%00&yesses=%27%22%00"),
+    }
 
     INPUTS = {
         "origins": {
             "required_keys": ["ip", "domain", "url"],
             "description": "Required. Origins to get error pages",
         },
+        "probes": {
+            "required_keys": None,
+            "description": "Names of the probes to send to each origin (see description).",
+            "default": list(PROBES),
+        },
+        "parallel_requests": {
+            "required_keys": None,
+            "description": "Number of origins to probe in parallel.",
+            "default": 20,
+        },
     }
 
     OUTPUTS = {
@@ -33,33 +74,77 @@ class ErrorPaths(YModule):
         }
     }
 
-    def run(self):
+    async def run(self):
         # read user agents list
-        user_agents = utils.read_file(self.USER_AGENTS_LIST)
+        self.user_agents = utils.read_file(self.USER_AGENTS_LIST)
 
-        if not user_agents:
+        if not self.user_agents:
             log.error("Could not open user agent list")
             return
 
-        for origin in self.origins:
-            with utils.force_ip_connection(origin["domain"], origin["ip"]):
-                parsed_url = utils.UrlParser(origin["url"])
-
-                with requests.Session() as req_sess:
-                    # get page with 404 not found error
-                    r = req_sess.get(
-                        f"{parsed_url.origin}/yesses-scanner-nonexisting-url/opdvsltqfnlcelh/ddsleo/glcgrfmr.html",
-                        headers={
-                            "User-Agent": user_agents[randint(0, len(user_agents) - 1)]
-                        },
-                    )
-                    parsed_url = utils.UrlParser(r.url)
-
-                    header_list = utils.convert_header(r)
-                    self.results["Error-Pages"].append(
-                        {
-                            "url": parsed_url.full_url(),
-                            "header": header_list,
-                            "data": r.text,
-                        }
-                    )
+        for probe in self.probes:
+            if probe not in self.PROBES:
+                raise Exception(f"Unknown probe for error pages: {probe}")
+
+        # identical error pages of different origins share one string
+        self.bodies = {}
+        self.bodies_lock = threading.Lock()
+
+        limit = asyncio.Semaphore(self.parallel_requests)
+
+        async def probe(origin):
+            async with limit:
+                await self.run_blocking(self.probe_origin, origin)
+
+        await asyncio.gather(*(probe(origin) for origin in self.origins))
+
+    def probe_origin(self, origin):
+        parsed_url = utils.UrlParser(origin["url"])
+        seen = set()
+        with utils.force_ip_connection(
+            origin["domain"], origin["ip"], thread_local=True
+        ), self.http_session() as req_sess:
+            for probe in self.probes:
+                r = self.send_probe(req_sess, origin["ip"], parsed_url.origin, probe)
+                if r is None or r.status_code < 400:
+                    continue
+
+                data = self.shared_body(r.text)
+                if (r.status_code, data) in seen:
+                    log.debug(f"{probe} on {parsed_url.origin}: same page as before")
+                    continue
+                seen.add((r.status_code, data))
+
+                self.emit(
+                    "Error-Pages",
+                    {
+                        "url": utils.UrlParser(r.url).full_url(),
+                        "header": utils.convert_header(r),
+                        "data": data,
+                    },
+                )
+
+    def send_probe(self, req_sess, ip, origin_url, probe):
+        method, path = self.PROBES[probe]
+        with get_host_controller().request(ip) as slot:
+            try:
+                r = req_sess.request(
+                    method,
+                    f"{origin_url}{path}",
+                    headers={
+                        "User-Agent": self.user_agents[
+                            randint(0, len(self.user_agents) - 1)
+                        ]
+                    },
+                    timeout=slot.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                slot.fail()
+                log.info(f"Cannot get error page ({probe}) from {origin_url}: {e}")
+                return None
+            return slot.check(r)
+
+    def shared_body(self, data):
+        key = hashlib.sha256(data.encode(errors="replace")).digest()
+        with self.bodies_lock:
+            return self.bodies.setdefault(key, data)
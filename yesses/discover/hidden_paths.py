@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 import logging
 import requests
 import threading
@@ -8,6 +8,7 @@ import math
 
 from yesses.module import YModule
 from yesses import utils
+from yesses.hostcontrol import get_host_controller
 
 logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
@@ -16,8 +17,11 @@ log = logging.getLogger("discover/hidden_paths")
 
 
 class HiddenPathsSession(utils.ConcurrentSession):
-    def __init__(self, task_queue: queue.Queue, dir_list: List, threads: int):
+    def __init__(
+        self, task_queue: queue.Queue, dir_list: List, threads: int, ip: str
+    ):
         super().__init__(threads)
+        self.ip = ip
         self.task_queue = task_queue
         self.dir_list = dir_list  # type: List[str]
         self.pages_found = []  # type: List[utils.UrlParser]
@@ -63,13 +67,22 @@ class HiddenPaths(YModule):
             "description": "Number of threads to run search in parallel",
             "default": THREADS,
         },
+        "revalidate": {
+            "required_keys": None,
+            "description": "Use conditional requests for pages found in the previous run and reuse "
+            "the stored page if it was not modified",
+            "default": True,
+        },
     }
 
     OUTPUTS = {
         "Hidden-Paths": {"provided_keys": ["url",], "description": "All hidden paths"},
         "Hidden-Pages": {
-            "provided_keys": ["url", "header", "data"],
-            "description": "Pages and the content from the page",
+            "provided_keys": ["url", "header", "data", "validators"],
+            "description": "Pages and the content from the page. `header` contains the response "
+            "headers, which can be used as a list of `Name: value` strings. "
+            "`validators` contains the ETag, Last-Modified and body hash used to "
+            "revalidate the page in the next run",
         },
         "Directories": {
             "provided_keys": ["url"],
@@ -97,44 +110,57 @@ class HiddenPaths(YModule):
         self.get_potential_dirs()
         self.linked_urls = [item["url"] for item in self.linked_paths]
 
-        filtered_origins = utils.filter_origins(self.origins)
-
-        for origin in filtered_origins.values():
-            with utils.force_ip_connection(origin["domain"], origin["ip"]):
-                parsed_url = utils.UrlParser(origin["url"])
-
-                # check if the web server replies to a random path which should not exist with a 200 status
-                r = requests.get(
-                    f"{parsed_url.origin}/yesses-scanner-nonexisting-url/opdvsltqfnlcelh/ddsleo/glcgrfmr.html",
-                    headers={
-                        "User-Agent": self.user_agents[
-                            randint(0, len(self.user_agents) - 1)
-                        ]
-                    },
-                )
-                if r.status_code == 200:
-                    continue
-
-                # fill task queue with existing directories if there are any
-                dirs = self.potential_dirs[parsed_url.origin]
-                task_queue = queue.Queue()
-
-                for dir in dirs:
+        self.revalidator = utils.Revalidator(
+            self.get_previous_results("Hidden-Pages"), self.revalidate
+        )
+
+        with self.http_session() as session:
+            filtered_origins = utils.filter_origins(self.origins, session)
+
+            for origin in filtered_origins.values():
+                with utils.force_ip_connection(origin["domain"], origin["ip"]):
+                    parsed_url = utils.UrlParser(origin["url"])
+
+                    # check if the web server replies to a random path which should not exist with a 200 status
+                    with get_host_controller().request(origin["ip"]) as slot:
+                        try:
+                            r = session.get(
+                                f"{parsed_url.origin}/yesses-scanner-nonexisting-url/opdvsltqfnlcelh/ddsleo/glcgrfmr.html",
+                                headers={
+                                    "User-Agent": self.user_agents[
+                                        randint(0, len(self.user_agents) - 1)
+                                    ]
+                                },
+                                timeout=slot.timeout,
+                            )
+                        except requests.exceptions.RequestException as e:
+                            slot.fail()
+                            log.info(f"Skipping {parsed_url.origin}: {e}")
+                            continue
+                        slot.check(r)
+                    if r.status_code == 200:
+                        continue
+
+                    # fill task queue with existing directories if there are any
+                    dirs = self.potential_dirs[parsed_url.origin]
+                    task_queue = queue.Queue()
+
+                    for dir in dirs:
+                        for i in range(self.threads):
+                            task_queue.put((dir, i))
+
+                    ths = []
+                    sess = HiddenPathsSession(
+                        task_queue, dir_list, self.threads, origin["ip"]
+                    )
                     for i in range(self.threads):
-                        task_queue.put((dir, i))
+                        ths.append(self.start_worker(self.worker, sess))
 
-                ths = []
-                sess = HiddenPathsSession(task_queue, dir_list, self.threads)
-                for i in range(self.threads):
-                    th = threading.Thread(target=self.worker, args=(sess,))
-                    th.start()
-                    ths.append(th)
-
-                for th in ths:
-                    th.join()
+                    for th in ths:
+                        th.join()
 
     def worker(self, sess: HiddenPathsSession):
-        with requests.Session() as req_sess:
+        with self.http_session() as req_sess:
             sess.register_thread(threading.current_thread().ident)
             self_finished = False
             while not sess.is_ready():
@@ -148,46 +174,56 @@ class HiddenPaths(YModule):
                     sess.ready(threading.current_thread().ident)
                     continue
 
-                self.process_task(task, req_sess, sess)
+                with self.worker_errors():
+                    self.process_task(task, req_sess, sess)
 
     def process_task(self, task, req_sess: requests.Session, sess: HiddenPathsSession):
         url, i = task
         length = max(math.ceil(len(sess.dir_list) / self.threads), 1)
         for dir in sess.dir_list[i * length : (i + 1) * length]:
             tmp_url = f"{url}{dir}"
-            r = req_sess.get(
-                tmp_url,
-                headers={
-                    "User-Agent": self.user_agents[
-                        randint(0, len(self.user_agents) - 1)
-                    ]
-                },
-            )
+            with get_host_controller().request(sess.ip) as slot:
+                try:
+                    r, previous_page = self.revalidator.get(
+                        req_sess,
+                        tmp_url,
+                        headers={
+                            "User-Agent": self.user_agents[
+                                randint(0, len(self.user_agents) - 1)
+                            ]
+                        },
+                        timeout=slot.timeout,
+                    )
+                except requests.exceptions.RequestException as e:
+                    slot.fail()
+                    log.debug(f"Cannot retrieve {tmp_url}: {e}")
+                    continue
+                slot.check(r)
             parsed_url = utils.UrlParser(r.url)
+            # a page that was not modified counts as found
+            status_code = 200 if previous_page is not None else r.status_code
 
             # process pages
             if (
-                r.status_code != 404
+                status_code != 404
                 and parsed_url.full_url() not in self.linked_urls
                 and not parsed_url.path.endswith("/")
                 and not ("index" in dir and url in self.linked_urls)
-                and parsed_url not in sess.pages_found
+                and sess.add_new(sess.pages_found, parsed_url)
             ):
-                self.results["Hidden-Paths"].append({"url": parsed_url.full_url()})
-                sess.pages_found.append(parsed_url)
+                self.emit("Hidden-Paths", {"url": parsed_url.full_url()})
                 log.debug(f"Hidden page found: {parsed_url.full_url()}")
-                self.add_hidden_pages(parsed_url, r)
+                self.add_hidden_pages(parsed_url, r, previous_page)
 
             # process directories
             if (
-                (r.status_code == 403 or r.status_code == 200)
+                (status_code == 403 or status_code == 200)
                 and parsed_url.path.endswith("/")
-                and parsed_url not in sess.dirs_found
+                and sess.add_new(sess.dirs_found, parsed_url)
             ):
                 log.debug(f"Directory found: {parsed_url.full_url()}")
-                sess.dirs_found.append(parsed_url)
-                self.results["Directories"].append({"url": parsed_url.full_url()})
-                self.add_hidden_pages(parsed_url, r)
+                self.emit("Directories", {"url": parsed_url.full_url()})
+                self.add_hidden_pages(parsed_url, r, previous_page)
                 if parsed_url.path_depth <= self.recursion_depth:
                     for i in range(self.threads):
                         sess.task_queue.put((parsed_url.full_url(), i))
@@ -213,9 +249,15 @@ class HiddenPaths(YModule):
                 if tmp not in self.potential_dirs[parsed_url.origin]:
                     self.potential_dirs[parsed_url.origin].append(tmp)
 
-    def add_hidden_pages(self, parsed_url: utils.UrlParser, r: requests.Response):
-        if utils.request_is_text(r):
-            header_list = utils.convert_header(r)
-            self.results["Hidden-Pages"].append(
-                {"url": parsed_url.full_url(), "header": header_list, "data": r.text}
+    def add_hidden_pages(
+        self,
+        parsed_url: utils.UrlParser,
+        r: requests.Response,
+        previous_page: Optional[Dict],
+    ):
+        if previous_page is not None:
+            self.emit("Hidden-Pages", previous_page)
+        elif utils.request_is_text(r):
+            self.emit(
+                "Hidden-Pages", utils.page_from_response(parsed_url.full_url(), r)
             )
@@ -10,6 +10,7 @@ import queue
 
 from yesses.module import YModule
 from yesses import utils
+from yesses.hostcontrol import get_host_controller
 
 logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
@@ -21,6 +22,7 @@ class LinkedPathsSession(utils.ConcurrentSession):
     def __init__(self, origin: Dict, threads: int):
         super().__init__(threads)
         start_parsed_url = utils.UrlParser(origin["url"])
+        self.ip = origin["ip"]
         self.task_queue = queue.Queue()  # type: queue.Queue[utils.UrlParser]
         self.task_queue.put(start_parsed_url)
         self.regex = re.compile(
@@ -57,6 +59,12 @@ class LinkedPaths(YModule):
             "description": "Number of threads to run search in parallel",
             "default": THREADS,
         },
+        "revalidate": {
+            "required_keys": None,
+            "description": "Use conditional requests for pages found in the previous run and reuse "
+            "the stored page if it was not modified",
+            "default": True,
+        },
     }
 
     OUTPUTS = {
@@ -65,8 +73,11 @@ class LinkedPaths(YModule):
             "description": "List of all linked pages from the url",
         },
         "Linked-Pages": {
-            "provided_keys": ["url", "header", "data"],
-            "description": "Pages and the content from the page",
+            "provided_keys": ["url", "header", "data", "validators"],
+            "description": "Pages and the content from the page. `header` contains the response "
+            "headers, which can be used as a list of `Name: value` strings. "
+            "`validators` contains the ETag, Last-Modified and body hash used to "
+            "revalidate the page in the next run",
         },
     }
 
@@ -78,7 +89,12 @@ class LinkedPaths(YModule):
             log.error("Could not open user agent list")
             return
 
-        filtered_origins = utils.filter_origins(self.origins)
+        self.revalidator = utils.Revalidator(
+            self.get_previous_results("Linked-Pages"), self.revalidate
+        )
+
+        with self.http_session() as session:
+            filtered_origins = utils.filter_origins(self.origins, session)
 
         for origin in filtered_origins.values():
             with utils.force_ip_connection(origin["domain"], origin["ip"]):
@@ -87,9 +103,7 @@ class LinkedPaths(YModule):
 
                 ths = []
                 for i in range(self.threads):
-                    th = threading.Thread(target=self.worker, args=(sess,))
-                    th.start()
-                    ths.append(th)
+                    ths.append(self.start_worker(self.worker, sess))
 
                 for th in ths:
                     th.join()
@@ -97,7 +111,7 @@ class LinkedPaths(YModule):
                 log.debug(f"Scraped site in {time.time() - start}s")
 
     def worker(self, sess: LinkedPathsSession):
-        with requests.Session() as req_sess:
+        with self.http_session() as req_sess:
             sess.register_thread(threading.current_thread().ident)
             self_finished = False
             while not sess.is_ready():
@@ -111,7 +125,8 @@ class LinkedPaths(YModule):
                     sess.ready(threading.current_thread().ident)
                     continue
 
-                self.scrape_urls(task, req_sess, sess)
+                with self.worker_errors():
+                    self.scrape_urls(task, req_sess, sess)
 
     def scrape_urls(
         self,
@@ -119,13 +134,25 @@ class LinkedPaths(YModule):
         req_sess: requests.Session,
         sess: LinkedPathsSession,
     ):
-        # get new page
-        r = req_sess.get(
-            parsed_url.full_url(),
-            headers={
-                "User-Agent": self.user_agents[randint(0, len(self.user_agents) - 1)]
-            },
-        )
+        # get new page; previous_page is set if the page was not modified
+        # since the last run
+        with get_host_controller().request(sess.ip) as slot:
+            try:
+                r, previous_page = self.revalidator.get(
+                    req_sess,
+                    parsed_url.full_url(),
+                    headers={
+                        "User-Agent": self.user_agents[
+                            randint(0, len(self.user_agents) - 1)
+                        ]
+                    },
+                    timeout=slot.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                slot.fail()
+                log.debug(f"Cannot retrieve {parsed_url}: {e}")
+                return
+            slot.check(r)
         # parse url returned by requests in the case we have been redirected
         forwarded_parsed_url = utils.UrlParser(r.url)
 
@@ -133,31 +160,25 @@ class LinkedPaths(YModule):
         # this again because we could have been redirected to a page we have
         # already visited. We also have to check again if it's a local page
         # because we could have been redirected to another website.
-        if forwarded_parsed_url not in sess.urls_visited and re.match(
-            sess.regex, forwarded_parsed_url.full_url()
+        if re.match(sess.regex, forwarded_parsed_url.full_url()) and sess.add_new(
+            sess.urls_visited, forwarded_parsed_url
         ):
-            sess.urls_visited.append(forwarded_parsed_url)
-            self.results["Linked-Paths"].append(
-                {"url": forwarded_parsed_url.full_url()}
-            )
-            header_list = utils.convert_header(r)
-            self.results["Linked-Pages"].append(
-                {
-                    "url": forwarded_parsed_url.full_url(),
-                    "header": header_list,
-                    "data": r.text,
-                }
-            )
+            self.emit("Linked-Paths", {"url": forwarded_parsed_url.full_url()})
+            if previous_page is None:
+                page = utils.page_from_response(forwarded_parsed_url.full_url(), r)
+            else:
+                page = previous_page
+            self.emit("Linked-Pages", page)
         else:
             return
 
         log.debug(forwarded_parsed_url)
 
         # check if this page is parsable by beautiful soup
-        if not utils.request_is_text(r):
+        if not utils.page_is_text(page):
             return
 
-        soup = BeautifulSoup(r.text, "lxml")
+        soup = BeautifulSoup(page["data"], "lxml")
 
         # get all linked pages and css files
         links = [
@@ -1,8 +1,12 @@
 import requests
 import json
 import logging
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from yesses.module import YModule, YExample
-from time import sleep
+from yesses.domaintrie import DomainTrie
+from yesses.cache import active_cache
+from time import sleep, time
 
 log = logging.getLogger("discover/tls_certificates")
 
@@ -12,7 +16,19 @@ class TLSCertificates(YModule):
 https://sslmate.com/certspotter) for existing TLS certificates for
 given domains and their subdomains.
 
-Note: The output may contain wildcards, e.g., '*.example.com'.
+Note: The output may contain wildcards, e.g., '*.example.com'. Names
+are normalized to lowercase without trailing dot, and names occurring
+in several certificates are only listed once.
+
+The log is queried incrementally: for each seed, the ID of the last
+certificate seen as well as the names and keys found so far are stored
+in the cache. Later runs only fetch certificates that were logged
+since; after `cache_ttl`, the full log is fetched again. This requires
+the cache setting `persist` (see the `cache` section of the
+configuration). The cache is also saved when a run is interrupted, so
+that the next run continues where the fetch stopped. Seeds are queried
+in parallel; when the log rejects requests, yesses waits as long as
+requested by the `Retry-After` header or backs off exponentially.
 
     """
 
@@ -21,7 +37,27 @@ Note: The output may contain wildcards, e.g., '*.example.com'.
             "required_keys": ["domain"],
             "description": "List of domains for search. Certificates for domains in this list and their subdomains will be found",
             "unwrap": True,
-        }
+        },
+        "parallel_requests": {
+            "required_keys": None,
+            "description": "Number of seeds to query in parallel.",
+            "default": 4,
+        },
+        "incremental": {
+            "required_keys": None,
+            "description": "Only fetch certificates logged since the last run (requires the cache setting `persist`). If false, the full log is fetched for each seed.",
+            "default": True,
+        },
+        "cache_ttl": {
+            "required_keys": None,
+            "description": "Time in seconds after which the full log is fetched again for a seed, so that names and keys are not kept forever.",
+            "default": 30 * 24 * 3600,
+        },
+        "api_url": {
+            "required_keys": None,
+            "description": "URL of the certspotter-compatible issuances API.",
+            "default": "https://api.certspotter.com/v1/issuances",
+        },
     }
 
     OUTPUTS = {
@@ -49,56 +85,125 @@ Note: The output may contain wildcards, e.g., '*.example.com'.
         )
     ]
 
-    base_url = "https://api.certspotter.com/v1/issuances?domain={}&include_subdomains=true&expand=dns_names"
     user_agent = (
         "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:40.0) Gecko/20100101 Firefox/40.1"
     )
 
+    CACHE_NAMESPACE = "ctlog"
+
     TRIES = 20
     WAIT = 10
+    MAX_WAIT = 300
 
     def run(self):
-        domains = set()
+        if self.incremental and not active_cache().is_persistent():
+            log.warning(
+                "Without the cache setting `persist`, the full log is fetched in each run."
+            )
+        domains = DomainTrie()
         certs = set()
 
-        for d in self.seeds:
-            found_domains, found_certs = self.from_ctlog(d)
-            domains |= found_domains
-            certs |= found_certs
+        with self.thread_pool(self.parallel_requests) as executor:
+            for found_domains, found_certs in executor.map(self.from_ctlog, self.seeds):
+                for name in found_domains:
+                    domains.add(name)
+                certs |= found_certs
 
         self.results["TLS-Names"] = [{"domain": d} for d in domains]
         self.results["TLS-Certificates"] = [{"pubkey": c} for c in certs]
 
     def from_ctlog(self, query_domain):
-        start_url = self.base_url.format(query_domain)
-        url = start_url
-
-        data = []
-
-        tries = self.TRIES
-        while tries:
-            req = requests.get(url, headers={"User-Agent": self.user_agent})
-            if req.ok:
-                content = req.json()
-                if len(content) == 0:
-                    break
-                else:
-                    data += content
-                    url = (
-                        start_url + f"&after={content[-1]['id']}"
-                    )  # pagination: go to next page
+        cache = active_cache()
+        cache_key = f"{self.api_url} {query_domain}"
+        state = None
+        if self.incremental:
+            state = cache.get(self.CACHE_NAMESPACE, cache_key)
+        if state is None:
+            state = {"cursor": None, "names": [], "pubkeys": []}
+        # when the full log was fetched last
+        since = state.get("since", time())
+
+        found_domains = set(state["names"])
+        found_certs = set(state["pubkeys"])
+        cursor = state["cursor"]
+        log.info(f"Fetching certificates for {query_domain} after {cursor}")
+
+        while True:
+            content = self.fetch_page(query_domain, cursor)
+            if len(content) == 0:
+                break
+            found_domains |= set(name for crt in content for name in crt["dns_names"])
+            found_certs |= set(crt["pubkey_sha256"] for crt in content)
+            cursor = content[-1]["id"]  # pagination: go to next page
+
+            # store the progress after each page, so an interrupted
+            # run does not need to fetch these pages again
+            cache.set(
+                self.CACHE_NAMESPACE,
+                cache_key,
+                {
+                    "cursor": cursor,
+                    "names": sorted(found_domains),
+                    "pubkeys": sorted(found_certs),
+                    "since": since,
+                },
+                ttl=since + self.cache_ttl - time(),
+            )
+
+        return found_domains, found_certs
+
+    def fetch_page(self, query_domain, cursor):
+        params = {
+            "domain": query_domain,
+            "include_subdomains": "true",
+            "expand": "dns_names",
+        }
+        if cursor is not None:
+            params["after"] = cursor
+
+        for attempt in range(self.TRIES):
+            try:
+                req = requests.get(
+                    self.api_url,
+                    params=params,
+                    headers={"User-Agent": self.user_agent},
+                    timeout=60,
+                )
+            except requests.exceptions.RequestException as e:
+                log.info(f"Error retrieving certificates for {query_domain}: {e}")
+                wait = self.backoff(attempt)
             else:
+                if req.ok:
+                    return req.json()
                 log.info(
-                    f"Error retrieving {url}, trying again in {self.WAIT} seconds."
+                    f"Error retrieving {req.url} (status code {req.status_code})."
                 )
-                tries -= 1
-                sleep(self.WAIT)
-        else:
-            raise Exception(f"Cannot retrieve certificate transparency log from {url}")
+                wait = self.retry_after(req)
+                if wait is None:
+                    wait = self.backoff(attempt)
+            log.info(f"Trying again in {wait} seconds.")
+            sleep(wait)
+
+        raise Exception(
+            f"Cannot retrieve certificate transparency log for {query_domain} from {self.api_url}"
+        )
 
-        found_domains = set(name for crt in data for name in crt["dns_names"])
-        found_certs = set(crt["pubkey_sha256"] for crt in data)
-        return found_domains, found_certs
+    def backoff(self, attempt):
+        return min(self.MAX_WAIT, self.WAIT * 2 ** attempt)
+
+    def retry_after(self, req):
+        value = req.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            wait = int(value)
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            wait = (date - datetime.now(timezone.utc)).total_seconds()
+        return min(self.MAX_WAIT, max(0, wait))
 
 
 if __name__ == "__main__":
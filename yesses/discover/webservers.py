@@ -1,5 +1,11 @@
 import logging
+import socket
+import threading
+from itertools import zip_longest
 from yesses.utils import force_ip_connection
+from yesses.reachability import get_reachability_cache
+from yesses.hostcontrol import get_host_controller
+from yesses.iprange import expand_ip_entries
 import requests
 from yesses.module import YModule, YExample
 
@@ -16,6 +22,12 @@ be encountered. This can cause a high number of errors, in particular
 TLS errors where the wrong certificate is encountered. These errors
 are not necessarily a sign of a problem.
 
+The combinations of IPs, domains and protocols are probed in
+parallel. Before probing, each IP and port is checked with a TCP
+connect; if the port is not reachable, all domains on this IP and port
+are reported in `Other-Error-Domains` without further requests. Only
+the status line and headers of each response are read.
+
     """
 
     PORTS = [{"port": 80}, {"port": 443}]
@@ -23,7 +35,7 @@ are not necessarily a sign of a problem.
     INPUTS = {
         "ips": {
             "required_keys": ["ip", "port"],
-            "description": "IPs and ports to scan (e.g., from the Ports module: Host-Ports)",
+            "description": "IPs and ports to scan (e.g., from the Ports module: Host-Ports). IPs can also be CIDR ranges.",
         },
         "domains": {
             "required_keys": ["domain"],
@@ -42,6 +54,22 @@ are not necessarily a sign of a problem.
             "default": [{"status_code": 500}],
             "unwrap": True,
         },
+        "timeout": {
+            "required_keys": None,
+            "description": "Timeout in seconds for connecting to a server and for the first requests to it; "
+            "afterwards, the timeout is derived from the observed response times",
+            "default": 10,
+        },
+        "parallel_requests": {
+            "required_keys": None,
+            "description": "Number of requests to run in parallel",
+            "default": 50,
+        },
+        "parallel_requests_per_ip": {
+            "required_keys": None,
+            "description": "Maximum number of parallel requests to a single IP",
+            "default": 5,
+        },
     }
 
     OUTPUTS = {
@@ -101,48 +129,130 @@ are not necessarily a sign of a problem.
         other_error_domains = []
         tls_error_domains = []
         tls_domains = []
-        for ip in self.ips:
-            # just check a port if it is open and in the list of passed ports
-            if ip["port"] in self.ports:
-                for domain in self.domains:
-                    for protocol in ("http", "https"):
-                        with force_ip_connection(domain, ip["ip"]):
-                            url = f"{protocol}://{domain}:{ip['port']}/"
-                            el = {
-                                "url": url,
-                                "domain": domain,
-                                "ip": ip,
-                                "port": ip["port"],
-                            }
-                            try:
-                                result = requests.get(url, timeout=10)
-                            except requests.exceptions.SSLError as e:
-                                el["error"] = str(e)
-                                tls_error_domains.append(el)
-                            except requests.exceptions.RequestException as e:
-                                el["error"] = str(e)
-                                other_error_domains.append(el)
-                            else:
-                                if result.status_code in self.ignore_errors:
-                                    log.debug(
-                                        f"Error code {result.status_code} on {url}, ip={ip['ip']}; skipping."
-                                    )
-                                    continue
-                                el = {"url": url, "domain": domain, "ip": ip["ip"]}
-                                if protocol == "https":
-                                    output_secure.append(el)
-                                    dom = {"domain": domain}
-                                    if not dom in tls_domains:
-                                        tls_domains.append(dom)
-                                else:
-                                    output_insecure.append(el)
-                                log.info(f"Found webserver {url} on {ip['ip']}")
+
+        # just check a port if it is open and in the list of passed ports
+        ips = [ip for ip in expand_ip_entries(self.ips) if ip["port"] in self.ports]
+        self.ip_limits = {
+            ip["ip"]: threading.BoundedSemaphore(self.parallel_requests_per_ip)
+            for ip in ips
+        }
+
+        with self.thread_pool(self.parallel_requests) as executor:
+            endpoints = list(set((ip["ip"], ip["port"]) for ip in ips))
+            connect_errors = dict(
+                zip(endpoints, executor.map(self.check_port, endpoints))
+            )
+
+            probes = [
+                (ip, domain, protocol)
+                for ip in ips
+                for domain in self.domains
+                for protocol in ("http", "https")
+            ]
+            # round robin over the IPs, so that pool threads waiting for
+            # the limit of one IP do not hold back the probes of others
+            by_ip = {}
+            for index, (ip, _, _) in enumerate(probes):
+                by_ip.setdefault(ip["ip"], []).append(index)
+            order = [
+                index
+                for batch in zip_longest(*by_ip.values())
+                for index in batch
+                if index is not None
+            ]
+            probe_results = dict(
+                zip(
+                    order,
+                    executor.map(
+                        lambda index: self.probe(*probes[index], connect_errors),
+                        order,
+                    ),
+                )
+            )
+
+            for index, (ip, domain, protocol) in enumerate(probes):
+                category, el = probe_results[index]
+                if category == "tls_error":
+                    tls_error_domains.append(el)
+                elif category == "other_error":
+                    other_error_domains.append(el)
+                elif category == "secure":
+                    output_secure.append(el)
+                    dom = {"domain": domain}
+                    if not dom in tls_domains:
+                        tls_domains.append(dom)
+                elif category == "insecure":
+                    output_insecure.append(el)
+
         self.results["Insecure-Origins"] = output_insecure
         self.results["Secure-Origins"] = output_secure
         self.results["TLS-Error-Domains"] = tls_error_domains
         self.results["Other-Error-Domains"] = other_error_domains
         self.results["TLS-Domains"] = tls_domains
 
+    def check_port(self, endpoint):
+        """Try a TCP connection to the IP and port. Returns an error message
+        if the connection failed, None otherwise.
+
+        """
+        ip, port = endpoint
+        reachability = get_reachability_cache()
+        with self.ip_limits[ip]:
+            try:
+                reachability.check(ip, port)
+                sock = socket.create_connection((ip, port), timeout=self.timeout)
+            except OSError as e:
+                log.debug(f"Cannot connect to {ip} on port {port}: {e}")
+                reachability.record_failure(ip, port, e)
+                return str(e) or e.__class__.__name__
+            reachability.record_success(ip, port)
+            sock.close()
+            return None
+
+    def probe(self, ip, domain, protocol, connect_errors):
+        """Request the root URL of the domain on the given IP. Returns the
+        category of the result (None if the result is ignored) and
+        the finding.
+
+        """
+        url = f"{protocol}://{domain}:{ip['port']}/"
+        el = {
+            "url": url,
+            "domain": domain,
+            "ip": ip,
+            "port": ip["port"],
+        }
+
+        connect_error = connect_errors[(ip["ip"], ip["port"])]
+        if connect_error is not None:
+            el["error"] = f"Cannot connect to port {ip['port']}: {connect_error}"
+            return "other_error", el
+
+        with self.ip_limits[ip["ip"]], force_ip_connection(
+            domain, ip["ip"], thread_local=True
+        ), get_host_controller().request(ip["ip"], self.timeout) as slot:
+            try:
+                # only the status line and the headers are read
+                with requests.get(url, timeout=slot.timeout, stream=True) as result:
+                    status_code = slot.check(result).status_code
+            except requests.exceptions.SSLError as e:
+                el["error"] = str(e)
+                return "tls_error", el
+            except requests.exceptions.RequestException as e:
+                slot.fail()
+                el["error"] = str(e)
+                return "other_error", el
+
+        if status_code in self.ignore_errors:
+            log.debug(f"Error code {status_code} on {url}, ip={ip['ip']}; skipping.")
+            return None, None
+
+        log.info(f"Found webserver {url} on {ip['ip']}")
+        el = {"url": url, "domain": domain, "ip": ip["ip"]}
+        if protocol == "https":
+            return "secure", el
+        return "insecure", el
+
 
 if __name__ == "__main__":
     Webservers.selftest()
@@ -0,0 +1,119 @@
+import logging
+import time
+
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+from .cache import active_cache
+
+log = logging.getLogger("dnscache")
+
+
+class DNSCache:
+    """Caches the answers to DNS queries for all steps of a run.
+
+    Answers are cached for the TTL of the records. Negative answers
+    (NXDOMAIN and empty answers) are cached for the TTL given by the
+    SOA record in the authority section, i.e., the minimum of the SOA
+    record's TTL and its MINIMUM field (RFC 2308). Negative answers
+    without SOA record are not cached.
+
+    If the cache settings `persist` and `persist_dns` are true, the
+    answers are also stored in the cache file and reused in subsequent runs until they
+    expire.
+
+    """
+
+    NAMESPACE = "dns"
+
+    NEGATIVE_ANSWERS = {
+        "NXDOMAIN": dns.resolver.NXDOMAIN,
+        "NoAnswer": dns.resolver.NoAnswer,
+    }
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.persist = cache.setting("persist_dns", False)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(resolver, domain, rdtype):
+        nameservers = ",".join(sorted(str(ns) for ns in resolver.nameservers))
+        rdtype = dns.rdatatype.to_text(dns.rdatatype.RdataType.make(rdtype))
+        return f"{domain.rstrip('.').lower()} {rdtype} @{nameservers}"
+
+    def query(self, resolver, domain, rdtype):
+        """Return the list of records of type rdtype for domain, using the
+        given resolver on a cache miss. Raises NXDOMAIN or NoAnswer
+        like dns.resolver.Resolver.query.
+
+        """
+        rdtype = dns.rdatatype.RdataType.make(rdtype)
+        key = self.key(resolver, domain, rdtype)
+        entry = self.cache.get(self.NAMESPACE, key)
+        if entry is not None:
+            self.hits += 1
+            return self.from_entry(entry)
+
+        self.misses += 1
+        try:
+            answer = resolver.query(domain, rdtype)
+        except tuple(self.NEGATIVE_ANSWERS.values()) as e:
+            self.store_negative(key, e)
+            raise
+
+        records = list(answer)
+        ttl = answer.expiration - time.time()
+        if answer.rrset is not None and ttl > 0:
+            self.store(
+                key,
+                {
+                    "rdtype": int(rdtype),
+                    "records": [record.to_text() for record in records],
+                },
+                ttl,
+            )
+        return records
+
+    def store(self, key, entry, ttl):
+        self.cache.set(self.NAMESPACE, key, entry, ttl, transient=not self.persist)
+
+    def store_negative(self, key, exception):
+        if isinstance(exception, dns.resolver.NXDOMAIN):
+            responses = list(exception.kwargs.get("responses", {}).values())
+        else:
+            responses = [exception.kwargs.get("response")]
+
+        ttls = [self.negative_ttl(r) for r in responses if r is not None]
+        ttls = [ttl for ttl in ttls if ttl is not None]
+        if not ttls:
+            return
+
+        error = [
+            name
+            for name, cls in self.NEGATIVE_ANSWERS.items()
+            if type(exception) is cls
+        ][0]
+        self.store(key, {"error": error}, min(ttls))
+
+    @staticmethod
+    def negative_ttl(response):
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+        return None
+
+    def from_entry(self, entry):
+        if "error" in entry:
+            raise self.NEGATIVE_ANSWERS[entry["error"]]()
+        return [
+            dns.rdata.from_text(dns.rdataclass.IN, entry["rdtype"], text)
+            for text in entry["records"]
+        ]
+
+
+def get_dns_cache():
+    return active_cache().shared("dns", DNSCache)
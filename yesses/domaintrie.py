@@ -0,0 +1,120 @@
+class DomainTrie:
+    """A set of domain names, stored as a trie of their labels in
+    reverse order (`www.example.com` is stored as `com` → `example` →
+    `www`).
+
+    Membership tests, finding the parent domains of a name contained
+    in the set, and matching names against wildcards take time
+    proportional to the number of labels of the name, independent of
+    the size of the set.
+
+    Names are normalized (lowercase, without trailing dot), so adding
+    a name multiple times in different spellings stores it once.
+
+    """
+
+    END = ""  # key marking the end of a name; labels are never empty
+
+    def __init__(self, names=()):
+        self.root = {}
+        self.size = 0
+        for name in names:
+            self.add(name)
+
+    @staticmethod
+    def normalize(name):
+        return name.strip().rstrip(".").lower()
+
+    @classmethod
+    def labels(cls, name):
+        return cls.normalize(name).split(".")[::-1]
+
+    def add(self, name):
+        node = self.root
+        for label in self.labels(name):
+            node = node.setdefault(label, {})
+        if self.END not in node:
+            node[self.END] = self.normalize(name)
+            self.size += 1
+
+    def find_node(self, name):
+        node = self.root
+        for label in self.labels(name):
+            node = node.get(label)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, name):
+        node = self.find_node(name)
+        return node is not None and self.END in node
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        todo = [self.root]
+        while todo:
+            node = todo.pop()
+            for label, child in node.items():
+                if label == self.END:
+                    yield child
+                else:
+                    todo.append(child)
+
+    def parents(self, name):
+        """Yield the names in the set that are parent domains of name
+        (not including name itself), longest first."""
+        found = []
+        node = self.root
+        labels = self.labels(name)
+        for label in labels[:-1]:
+            node = node.get(label)
+            if node is None:
+                break
+            if self.END in node:
+                found.append(node[self.END])
+        return reversed(found)
+
+    def has_parent(self, name):
+        return next(iter(self.parents(name)), None) is not None
+
+    def relative_names(self, name):
+        """Yield name relative to each of its parent domains in the set,
+        e.g., `www.test` for `www.test.example.com` if `example.com`
+        is in the set."""
+        name = self.normalize(name)
+        for parent in self.parents(name):
+            yield name[: -(len(parent) + 1)]
+
+    def matches(self, name):
+        """Return True if name is in the set or is covered by a wildcard
+        in the set (`*.example.com` covers `www.example.com`, but not
+        `example.com` or `www.test.example.com`)."""
+        if name in self:
+            return True
+        labels = self.labels(name)
+        if len(labels) < 2:
+            return False
+        node = self.root
+        for label in labels[:-1]:
+            node = node.get(label)
+            if node is None:
+                return False
+        wildcard = node.get("*")
+        return wildcard is not None and self.END in wildcard
+
+    def subdomains(self, name):
+        """Yield the names in the set that are subdomains of name (not
+        including name itself)."""
+        node = self.find_node(name)
+        if node is None:
+            return
+        todo = [child for label, child in node.items() if label != self.END]
+        while todo:
+            node = todo.pop()
+            for label, child in node.items():
+                if label == self.END:
+                    yield child
+                else:
+                    todo.append(child)
@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import active_cache
+
+log = logging.getLogger("eventloop")
+
+
+class EventLoop:
+    """The asyncio event loop that runs the modules with `async def
+    run()` of all steps of a run. The loop runs in a background thread;
+    the step waits for its module to finish.
+
+    Blocking calls of these modules (e.g., requests) are run in one
+    thread pool (see YModule.run_blocking()). The size of the pool,
+    `async_concurrency` (default: 50), limits the number of such calls
+    running at the same time for the whole run, also when several
+    steps run at the same time (see `stream`).
+
+    """
+
+    def __init__(self, cache):
+        self.concurrency = cache.setting("async_concurrency", 50)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="yesses-async"
+        )
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="yesses-event-loop", daemon=True
+        )
+        self.thread.start()
+
+    def run(self, coroutine):
+        """Run the coroutine on the loop and return its result. Must not
+        be called from the loop itself. The coroutine runs in the context
+        of the caller (e.g., the step it belongs to)."""
+        context = contextvars.copy_context()
+
+        async def run_in_context():
+            for var, value in context.items():
+                var.set(value)
+            return await coroutine
+
+        return asyncio.run_coroutine_threadsafe(run_in_context(), self.loop).result()
+
+    def close(self):
+        """Stop the loop and its thread pool."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown()
+
+    def iterate(self, async_iterator):
+        """Iterate over an asynchronous iterator from outside of the
+        loop. Each item is fetched when it is requested, so that a slow
+        consumer does not block the loop."""
+
+        async def next_item():
+            return await async_iterator.__anext__()
+
+        while True:
+            try:
+                yield self.run(next_item())
+            except StopAsyncIteration:
+                return
+
+
+def get_event_loop():
+    return active_cache().shared("event-loop", EventLoop)
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
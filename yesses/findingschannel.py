@@ -0,0 +1,89 @@
+import hashlib
+import json
+import queue
+import threading
+
+
+class FindingsChannel:
+    """Passes findings from steps that are still running to a step that
+    consumes them at the same time (see the `stream` keyword).
+
+    Iterating over the channel yields the findings that already exist
+    in the findings list, then the findings published by the running
+    steps as they arrive, until all of these steps have finished.
+    Duplicate findings are skipped. At most MAX_BUFFERED findings are
+    waiting in the channel; further calls to put() block until the
+    consumer catches up.
+
+    """
+
+    MAX_BUFFERED = 100
+    END = object()
+
+    def __init__(self, initial, producers, required_keys=None):
+        self.initial = list(initial)
+        self.producers = producers
+        self.required_keys = required_keys
+        self.queue = queue.Queue(self.MAX_BUFFERED)
+        self.seen = set(self.key(finding) for finding in self.initial)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.consumed = False
+        self.items = []
+
+    @staticmethod
+    def key(finding):
+        # a digest instead of the serialized finding, so that large
+        # findings (e.g., pages) are not kept a second time
+        return hashlib.sha256(
+            json.dumps(finding, sort_keys=True, default=str).encode()
+        ).digest()
+
+    def put(self, finding):
+        key = self.key(finding)
+        with self.lock:
+            if self.closed or key in self.seen:
+                return
+            self.seen.add(key)
+        self.queue.put(finding)
+
+    def finish(self):
+        """Called by each producing step when it has finished."""
+        self.queue.put(self.END)
+
+    def close(self):
+        """Called by the consuming step when it has finished. Findings
+        that were not read are discarded, so that producers do not
+        block."""
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def __iter__(self):
+        if self.consumed:
+            yield from self.items
+            return
+        self.consumed = True
+        for finding in self.initial:
+            yield self.accept(finding)
+        remaining = self.producers
+        while remaining:
+            finding = self.queue.get()
+            if finding is self.END:
+                remaining -= 1
+                continue
+            yield self.accept(finding)
+
+    def accept(self, finding):
+        if self.required_keys is not None:
+            for key in self.required_keys:
+                if not isinstance(finding, dict) or key not in finding:
+                    raise Exception(
+                        f"Missing key '{key}' on streamed element '{finding}'."
+                    )
+        self.items.append(finding)
+        return finding
@@ -1,6 +1,7 @@
 import logging
 from .state import State
 from .parsers import UseParser
+from .iprange import IPRangeIndex, is_range
 from functools import reduce
 
 
@@ -87,12 +88,56 @@ class FindingsList:
         common_attrs = self.find_common_attributes(key1, key2)
         items1 = self.get(key1, common_attrs)
         items2 = self.get(key2, common_attrs)
+        if common_attrs == {"ip"} and any(
+            is_range(item["ip"]) for item in items1 + items2
+        ):
+            return self.get_common_and_missing_ips(items1, items2)
+
         common_items = [item for item in items1 if item in items2]
         missing_items = [item for item in items1 if item not in items2]
         equals = len(common_items) == len(items1) == len(items2)
 
         return common_items, missing_items, equals
 
+    def get_common_and_missing_ips(self, items1, items2):
+        """Like get_common_and_missing_items, for lists of IPs that
+        contain CIDR ranges. An item is common if its IP (or range) is
+        contained in a range (or equal to an IP) in items2. The ranges
+        are not expanded. Values that are neither IPs nor ranges (e.g.,
+        domain names) are compared as they are.
+
+        """
+        ips1, others1 = self.split_ips(items1)
+        ips2, others2 = self.split_ips(items2)
+        index = IPRangeIndex(ips2)
+
+        def contained(ip):
+            return ip in index or ip in others2
+
+        common_items = [item for item in items1 if contained(item["ip"])]
+        missing_items = [item for item in items1 if not contained(item["ip"])]
+        # since all items are contained in items2, the lists are equal
+        # if they cover the same number of addresses and other values
+        equals = (
+            not missing_items
+            and len(IPRangeIndex(ips1)) == len(index)
+            and len(set(others1)) == len(set(others2))
+        )
+
+        return common_items, missing_items, equals
+
+    @staticmethod
+    def split_ips(items):
+        """Split the values of `ip` into IPs or ranges and other values."""
+        ips = []
+        others = []
+        for item in items:
+            if IPRangeIndex.is_valid(item["ip"]):
+                ips.append(item["ip"])
+            else:
+                others.append(item["ip"])
+        return ips, others
+
     def get_added_items(self, key):
         """Return items that appear in the current findings list with the
         given key, but not in the previous one.
@@ -0,0 +1,162 @@
+import ast
+import re
+
+
+class HeaderExpression:
+    """A python expression on a header value (e.g., `max_age >= 31536000`),
+    parsed and compiled once.
+
+    Only a restricted subset of python is allowed: literals, the
+    variables `value` and `max_age`, comparisons, boolean and
+    arithmetic operators, and calls to `len`, `int` and to public
+    methods of the value (e.g., `value.startswith("enforce,")`).
+
+    """
+
+    NAMES = {"value", "max_age", "len", "int"}
+    FUNCTIONS = {"len": len, "int": int}
+    NODES = (
+        ast.Expression,
+        ast.BoolOp,
+        ast.BinOp,
+        ast.UnaryOp,
+        ast.Compare,
+        ast.Call,
+        ast.Attribute,
+        ast.Name,
+        ast.Constant,
+        ast.Load,
+        ast.boolop,
+        ast.operator,
+        ast.unaryop,
+        ast.cmpop,
+    )
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression, mode="eval")
+        for node in ast.walk(tree):
+            self.check_node(node)
+        self.code = compile(tree, f"<{expression}>", "eval")
+
+    def check_node(self, node):
+        if not isinstance(node, self.NODES):
+            raise Exception(
+                f"Expression '{self.expression}' contains unsupported element {node.__class__.__name__}."
+            )
+        if isinstance(node, ast.Name) and node.id not in self.NAMES:
+            raise Exception(
+                f"Expression '{self.expression}' uses unknown name {node.id}."
+            )
+        if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+            raise Exception(
+                f"Expression '{self.expression}' uses private attribute {node.attr}."
+            )
+
+    def evaluate(self, value):
+        # check if max_age attribute is set
+        match = re.search("max-age=([0-9]+)", value, re.IGNORECASE)
+        max_age = int(match.group(1)) if match else 0
+        return eval(
+            self.code,
+            {"__builtins__": {}},
+            {"value": value, "max_age": max_age, **self.FUNCTIONS},
+        )
+
+
+class HeaderRule:
+    """A rule on response headers as used in the configuration, e.g.,
+    `{"header": "Server", "value": ".* .*[0-9].*", "reason": "..."}`.
+
+    `header` and `value` are regular expressions matched against the
+    whole header name or value (case-insensitive); `value_expr` is a
+    HeaderExpression; `origin` restricts the rule to URLs starting with
+    the given regular expression.
+
+    """
+
+    LITERAL_NAME = re.compile(r"[A-Za-z0-9-]+")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.header = re.compile(rule["header"], re.IGNORECASE)
+        self.value = (
+            re.compile(rule["value"], re.IGNORECASE) if "value" in rule else None
+        )
+        self.value_expr = (
+            HeaderExpression(rule["value_expr"]) if "value_expr" in rule else None
+        )
+        self.origin = re.compile(rule["origin"]) if "origin" in rule else None
+
+        # rules for a fixed header name can be looked up by name
+        if self.LITERAL_NAME.fullmatch(rule["header"]):
+            self.name = rule["header"].lower()
+        else:
+            self.name = None
+
+    def applies_to(self, url):
+        return self.origin is None or self.origin.match(url) is not None
+
+    def matches(self, header, value):
+        header = header.strip()
+        value = value.strip()
+        if self.name is not None:
+            if header.lower() != self.name:
+                return False
+        elif not self.header.fullmatch(header):
+            return False
+
+        if self.value is not None:
+            return self.value.fullmatch(value) is not None
+        if self.value_expr is not None:
+            return bool(self.value_expr.evaluate(value))
+        return True
+
+
+class HeaderRuleSet:
+    """A list of HeaderRules, compiled once and indexed by header name,
+    so that the headers of a response are checked in one pass: each
+    header is only compared to the rules for its name and to the rules
+    using a pattern for the name.
+
+    """
+
+    def __init__(self, rules):
+        self.rules = [HeaderRule(rule) for rule in rules]
+        self.by_name = {}
+        self.patterns = []
+        for index, rule in enumerate(self.rules):
+            if rule.name is not None:
+                self.by_name.setdefault(rule.name, []).append((index, rule))
+            else:
+                self.patterns.append((index, rule))
+
+    def candidates(self, header):
+        return self.by_name.get(header.strip().lower(), []) + self.patterns
+
+    def match(self, headers, url=None):
+        """Return (rule, header, value) for each header that matches a
+        rule, ordered by rule and then by the order of the headers.
+        If url is given, rules that do not apply to the URL are
+        skipped.
+
+        """
+        matches = []
+        for position, (header, value) in enumerate(headers):
+            for index, rule in self.candidates(header):
+                if url is not None and not rule.applies_to(url):
+                    continue
+                if rule.matches(header, value):
+                    matches.append((index, position, rule, header, value))
+        matches.sort(key=lambda m: m[:2])
+        return [(rule, header, value) for _, _, rule, header, value in matches]
+
+    def missing(self, headers, url):
+        """Return the rules applying to the URL that are not matched by
+        any of the headers."""
+        matched = set(id(rule) for rule, _, _ in self.match(headers, url))
+        return [
+            rule
+            for rule in self.rules
+            if rule.applies_to(url) and id(rule) not in matched
+        ]
@@ -0,0 +1,199 @@
+import sys
+import threading
+import weakref
+from collections.abc import Sequence
+
+import yaml
+
+
+class Headers(Sequence):
+    """The headers of an HTTP response as stored in page findings.
+
+    The headers are kept as (name, value) pairs in the order they were
+    received; repeated headers, in particular each Set-Cookie header,
+    are separate entries. Structured access is provided by items(),
+    get(), get_all() and cookies().
+
+    Header names are kept as received. Lookups compare them
+    case-insensitively. To keep page findings small, the names and
+    short values are interned. Responses with exactly the same headers share one Headers
+    object, which is also written only once to the state file (as a
+    YAML alias).
+
+    For compatibility, a Headers object behaves like the list of
+    `"Name: value"` strings used before, with repeated headers (except
+    Set-Cookie) combined into one entry, separated by commas.
+
+    """
+
+    __slots__ = ("pairs", "keys", "__weakref__")
+
+    YAML_TAG = "!headers"
+    MAX_INTERN_LENGTH = 256
+    # not taken from a 304 response (see updated())
+    BODY_HEADERS = {"content-length", "content-encoding", "transfer-encoding"}
+
+    instances = weakref.WeakValueDictionary()
+    instances_lock = threading.Lock()
+
+    def __new__(cls, pairs=()):
+        pairs = tuple(
+            (sys.intern(name.strip()), cls.intern_value(value.strip()))
+            for name, value in pairs
+        )
+        with cls.instances_lock:
+            headers = cls.instances.get(pairs)
+            if headers is None:
+                headers = super().__new__(cls)
+                headers.pairs = pairs
+                headers.keys = tuple(cls.key(name) for name, _ in pairs)
+                cls.instances[pairs] = headers
+        return headers
+
+    @classmethod
+    def from_response(cls, r):
+        """Create the headers from a requests response, keeping
+        repeated headers."""
+        return cls(r.raw.headers.items())
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Create the headers from `"Name: value"` strings."""
+        if isinstance(lines, Headers):
+            return lines
+        pairs = []
+        for line in lines:
+            name, _, value = line.partition(":")
+            pairs.append((name, value))
+        return cls(pairs)
+
+    @staticmethod
+    def key(name):
+        """The lowercase name used to compare header names."""
+        return sys.intern(name.strip().lower())
+
+    @classmethod
+    def intern_value(cls, value):
+        if len(value) <= cls.MAX_INTERN_LENGTH:
+            return sys.intern(value)
+        return value
+
+    def items(self):
+        """Return the headers as (name, value) pairs."""
+        return list(self.pairs)
+
+    def get_all(self, name):
+        key = self.key(name)
+        return [value for k, (_, value) in zip(self.keys, self.pairs) if k == key]
+
+    def get(self, name, default=None):
+        """Return the value of a header; repeated headers are combined
+        (separated by commas)."""
+        values = self.get_all(name)
+        return ", ".join(values) if values else default
+
+    def merged(self):
+        """Return (name, value) pairs with repeated headers combined,
+        except for Set-Cookie. The name is spelled as in the first
+        header."""
+        merged = {}
+        result = []
+        for key, (name, value) in zip(self.keys, self.pairs):
+            if key == "set-cookie":
+                result.append([name, value])
+            elif key in merged:
+                merged[key][1] += f", {value}"
+            else:
+                merged[key] = [name, value]
+                result.append(merged[key])
+        return [(name, value) for name, value in result]
+
+    def updated(self, other):
+        """Return the headers updated with those of a 304 (Not Modified)
+        response: headers in `other` replace the stored headers with the
+        same name, except for those that describe the stored body."""
+        new = {}
+        for key, pair in zip(other.keys, other.pairs):
+            if key not in self.BODY_HEADERS:
+                new.setdefault(key, []).append(pair)
+        pairs = []
+        for key, pair in zip(self.keys, self.pairs):
+            if key not in new:
+                pairs.append(pair)
+            elif new[key] is not None:
+                # at the position of the first stored header
+                pairs += new[key]
+                new[key] = None
+        for added in new.values():
+            pairs += added or []
+        return Headers(pairs)
+
+    @property
+    def lines(self):
+        """The headers as `"Name: value"` strings (see above)."""
+        return [f"{name}: {value}" for name, value in self.merged()]
+
+    def cookies(self):
+        """Return (name, attributes) for each Set-Cookie header. The
+        attribute names are lowercase."""
+        cookies = []
+        for value in self.get_all("Set-Cookie"):
+            cookie, *attributes = value.split(";")
+            parsed = {}
+            for attribute in attributes:
+                key, _, attribute_value = attribute.partition("=")
+                if key.strip():
+                    parsed[key.strip().lower()] = attribute_value.strip()
+            cookies.append((cookie.partition("=")[0].strip(), parsed))
+        return cookies
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.merged())
+
+    def __eq__(self, other):
+        if isinstance(other, Headers):
+            return self.pairs == other.pairs
+        if isinstance(other, (list, tuple)):
+            return self.lines == list(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pairs)
+
+    def __repr__(self):
+        return f"Headers({list(self.pairs)!r})"
+
+    def __str__(self):
+        return str(self.lines)
+
+    def __reduce__(self):
+        return (Headers, (self.pairs,))
+
+
+def represent_headers(dumper, headers):
+    # one entry per received header, so that the headers can be restored
+    return dumper.represent_sequence(
+        Headers.YAML_TAG, [f"{name}: {value}" for name, value in headers.pairs]
+    )
+
+
+def represent_headers_as_list(dumper, headers):
+    return dumper.represent_list(headers.lines)
+
+
+def construct_headers(loader, node):
+    return Headers.from_lines(loader.construct_sequence(node))
+
+
+# The state files are written with yaml.dump() and read with
+# yaml.full_load(); outputs for humans are written with yaml.safe_dump().
+yaml.add_representer(Headers, represent_headers, Dumper=yaml.Dumper)
+yaml.add_representer(Headers, represent_headers_as_list, Dumper=yaml.SafeDumper)
+for loader in (yaml.Loader, yaml.FullLoader, yaml.SafeLoader):
+    yaml.add_constructor(Headers.YAML_TAG, construct_headers, Loader=loader)
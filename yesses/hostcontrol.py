@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .cache import active_cache
+
+log = logging.getLogger("hostcontrol")
+
+
+class HostState:
+    def __init__(self, initial_limit):
+        self.limit = initial_limit
+        self.active = 0
+        self.rtts = deque(maxlen=HostController.WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.completed_since_decrease = 0
+
+
+class RequestSlot:
+    """Handed out by HostController.request(). The module passes
+    `timeout` to its request and calls check() with the response, or
+    fail() if the request failed without raising an exception.
+    Responses served from the run-wide HTTP cache (see httpcache.py)
+    did not reach the host and are not counted."""
+
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.rtt = None
+        self.failed = False
+        self.cached = False
+
+    def check(self, response):
+        if getattr(response, "from_cache", False):
+            self.cached = True
+            return response
+        if response.status_code in self.THROTTLE_STATUS_CODES:
+            self.failed = True
+        self.rtt = response.elapsed.total_seconds()
+        return response
+
+    def fail(self):
+        self.failed = True
+
+
+class HostController:
+    """Shared between all HTTP-using modules of a run. Measures the
+    round-trip times and error rates per host and derives from them
+
+      * the timeout for requests to the host (a multiple of a high
+        percentile of the observed response times), and
+      * the number of concurrent requests to the host, which is
+        increased additively on success and halved on timeouts,
+        connection errors, or throttling responses (AIMD).
+
+    """
+
+    WINDOW = 100  # number of response times considered per host
+    MIN_SAMPLES = 10
+    PERCENTILE = 0.95
+    TIMEOUT_FACTOR = 4
+
+    DEFAULT_TIMEOUT = 10
+    MIN_TIMEOUT = 2
+    MAX_TIMEOUT = 30
+
+    INITIAL_LIMIT = 4
+    MIN_LIMIT = 1
+    MAX_LIMIT = 64
+
+    def __init__(self, _cache=None):
+        self.hosts = {}
+        self.condition = threading.Condition()
+
+    def get_host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.INITIAL_LIMIT)
+        return self.hosts[host]
+
+    def timeout(self, host, default=None):
+        """Return the timeout for requests to host. Until enough response
+        times have been observed, `default` is used.
+
+        """
+        if default is None:
+            default = self.DEFAULT_TIMEOUT
+        with self.condition:
+            rtts = sorted(self.get_host(host).rtts)
+        if len(rtts) < self.MIN_SAMPLES:
+            return default
+        percentile = rtts[min(len(rtts) - 1, int(len(rtts) * self.PERCENTILE))]
+        return min(
+            self.MAX_TIMEOUT, max(self.MIN_TIMEOUT, percentile * self.TIMEOUT_FACTOR)
+        )
+
+    def concurrency(self, host):
+        with self.condition:
+            return int(self.get_host(host).limit)
+
+    @contextmanager
+    def request(self, host, timeout=None):
+        """Wait until a request to the host is allowed, then yield a
+        RequestSlot. Exceptions raised within the context count as
+        errors.
+
+        """
+        slot = RequestSlot(self.timeout(host, timeout))
+        with self.condition:
+            state = self.get_host(host)
+            while state.active >= int(state.limit):
+                self.condition.wait()
+            state.active += 1
+
+        start = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            self.complete(host, None, failed=True)
+            raise
+        else:
+            if slot.cached:
+                self.release(host)
+                return
+            rtt = slot.rtt if slot.rtt is not None else time.monotonic() - start
+            self.complete(host, rtt, failed=slot.failed)
+
+    def release(self, host):
+        """Free the slot of a request that did not reach the host."""
+        with self.condition:
+            self.get_host(host).active -= 1
+            self.condition.notify_all()
+
+    def complete(self, host, rtt, failed):
+        with self.condition:
+            state = self.get_host(host)
+            state.active -= 1
+            state.requests += 1
+            state.completed_since_decrease += 1
+            if rtt is not None:
+                state.rtts.append(rtt)
+
+            if failed:
+                state.errors += 1
+                # decrease at most once per round of requests
+                if state.completed_since_decrease >= state.limit:
+                    state.limit = max(self.MIN_LIMIT, state.limit / 2)
+                    state.completed_since_decrease = 0
+                    log.debug(f"Reducing concurrency for {host} to {int(state.limit)}")
+            else:
+                state.limit = min(self.MAX_LIMIT, state.limit + 1 / state.limit)
+
+            self.condition.notify_all()
+
+    def error_rate(self, host):
+        with self.condition:
+            state = self.get_host(host)
+            return state.errors / state.requests if state.requests else 0
+
+
+def get_host_controller():
+    return active_cache().shared("hosts", HostController)
@@ -0,0 +1,217 @@
+import io
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from http.client import HTTPMessage
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+from .cache import active_cache
+from .utils import get_forced_ip
+
+log = logging.getLogger("httpcache")
+
+
+class ResponseCache:
+    """Caches the responses to GET and HEAD requests for all steps of a
+    run, so that a URL that is requested by several modules (e.g., the
+    root page of an origin) is only fetched once.
+
+    Responses are identified by the method, the URL, the IP the
+    request was sent to (see force_ip_connection), and the request
+    headers, except for headers that do not change the response
+    (User-Agent, Connection). Streamed requests are not cached, nor
+    are responses with a status code that is not cacheable by default
+    (e.g., 429 or 503) or with `Cache-Control: no-store`.
+
+    The cache holds up to `http_cache_size` megabytes of response
+    bodies in memory (default: 64). When the cache is full, the least
+    recently used responses are discarded or, with `http_cache_spill`,
+    moved to a temporary directory that is removed after the run. The
+    cache can be disabled with `http_cache: false`.
+
+    """
+
+    IGNORED_HEADERS = {"user-agent", "connection"}
+    METHODS = {"GET", "HEAD"}
+    # status codes that are cacheable by default (RFC 7231, section 6.1)
+    STATUSES = {200, 203, 204, 300, 301, 404, 405, 410, 414, 501}
+
+    def __init__(self, cache):
+        self.enabled = cache.setting("http_cache", True)
+        self.max_size = cache.setting("http_cache_size", 64) * 1024 * 1024
+        self.spill = cache.setting("http_cache_spill", False)
+        self.entries = OrderedDict()
+        self.spilled = {}
+        self.size = 0
+        self.directory = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, request, ip):
+        headers = sorted(
+            (name.lower(), value)
+            for name, value in request.headers.items()
+            if name.lower() not in self.IGNORED_HEADERS
+        )
+        return (request.method, request.url, ip, tuple(headers))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            elif key in self.spilled:
+                filename = self.spilled.pop(key)
+                with open(filename, "rb") as f:
+                    entry = pickle.load(f)
+                os.remove(filename)
+                self.add(key, entry)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def is_cacheable(self, entry):
+        if entry["status"] not in self.STATUSES:
+            return False
+        for name, value in entry["headers"]:
+            if name.lower() == "cache-control" and "no-store" in value.lower():
+                return False
+        return True
+
+    def put(self, key, entry):
+        if not self.is_cacheable(entry):
+            return
+        with self.lock:
+            if key not in self.entries:
+                self.add(key, entry)
+
+    def add(self, key, entry):
+        self.entries[key] = entry
+        self.size += len(entry["body"])
+        while self.size > self.max_size and self.entries:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.size -= len(old_entry["body"])
+            if self.spill:
+                self.spilled[old_key] = self.write(old_entry)
+
+    def close(self):
+        """Remove the responses moved to the temporary directory."""
+        with self.lock:
+            self.spilled = {}
+            if self.directory is not None:
+                self.directory.cleanup()
+                self.directory = None
+
+    def write(self, entry):
+        if self.directory is None:
+            self.directory = tempfile.TemporaryDirectory(prefix="yesses-http-")
+        fd, filename = tempfile.mkstemp(dir=self.directory.name)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f)
+        return filename
+
+
+class CachingAdapter(HTTPAdapter):
+    """A transport adapter for requests that answers GET and HEAD
+    requests from a ResponseCache."""
+
+    def __init__(self, response_cache, **kwargs):
+        super().__init__(**kwargs)
+        self.response_cache = response_cache
+
+    def send(self, request, stream=False, **kwargs):
+        if stream or request.method not in self.response_cache.METHODS:
+            return super().send(request, stream=stream, **kwargs)
+
+        ip = get_forced_ip(urlparse(request.url).hostname)
+        key = self.response_cache.key(request, ip)
+        entry = self.response_cache.get(key)
+        from_cache = entry is not None
+        if from_cache:
+            log.debug(f"Cached response for {request.method} {request.url}")
+        else:
+            entry = self.fetch(request, **kwargs)
+            self.response_cache.put(key, entry)
+        response = self.build_cached_response(request, entry)
+        # not counted as a request to the host (see RequestSlot.check())
+        response.from_cache = from_cache
+        return response
+
+    def fetch(self, request, **kwargs):
+        response = super().send(request, stream=True, **kwargs)
+        try:
+            # keep the body as sent by the server (e.g., gzip-compressed),
+            # so that it can be decoded again according to the headers
+            body = response.raw.read(decode_content=False)
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e, request=request)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+        finally:
+            response.close()
+        return {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": list(response.raw.headers.items()),
+            "body": body,
+        }
+
+    def build_cached_response(self, request, entry):
+        message = HTTPMessage()
+        for name, value in entry["headers"]:
+            message[name] = value
+        raw = HTTPResponse(
+            body=io.BytesIO(entry["body"]),
+            headers=HTTPHeaderDict(entry["headers"]),
+            status=entry["status"],
+            reason=entry["reason"],
+            preload_content=False,
+            original_response=CachedMessage(message),
+            request_method=request.method,
+        )
+        response = self.build_response(request, raw)
+        # read the body now, as for requests that are not streamed
+        response.content
+        return response
+
+
+class CachedMessage:
+    """Stands in for the http.client response of a cached response, so
+    that requests can read cookies from its headers."""
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def isclosed(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def get_response_cache():
+    return active_cache().shared("http-responses", ResponseCache)
+
+
+def cached_session(enabled=True):
+    """Return a requests session that uses the run-wide response cache
+    for GET and HEAD requests (unless disabled)."""
+    session = requests.Session()
+    response_cache = get_response_cache()
+    if enabled and response_cache.enabled:
+        adapter = CachingAdapter(response_cache)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
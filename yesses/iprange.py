@@ -0,0 +1,105 @@
+import bisect
+import ipaddress
+
+
+def is_range(value):
+    return "/" in str(value)
+
+
+def expand_ips(ips):
+    """Yield the IPs from a list of IPs and CIDR ranges (e.g.,
+    `192.0.2.0/24`). Ranges are expanded lazily to their host
+    addresses."""
+    for ip in ips:
+        if not is_range(ip):
+            yield ip
+            continue
+        network = ipaddress.ip_network(ip, strict=False)
+        if network.num_addresses == 1:
+            yield str(network.network_address)
+        else:
+            for address in network.hosts():
+                yield str(address)
+
+
+def expand_ip_entries(entries, key="ip"):
+    """Like expand_ips, but for findings: Each entry with a CIDR range
+    is replaced by copies of the entry for each IP in the range."""
+    for entry in entries:
+        if not is_range(entry[key]):
+            yield entry
+            continue
+        for ip in expand_ips([entry[key]]):
+            yield {**entry, key: ip}
+
+
+def ip_sort_key(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return (7, 0, ip)
+    return (address.version, int(address), ip)
+
+
+class IPRangeIndex:
+    """Answers membership queries for IPs and CIDR ranges against a
+    list of IPs and CIDR ranges without expanding the ranges.
+
+    The entries are stored as sorted, merged intervals of integers
+    (one list per IP version); a lookup is a binary search.
+
+    """
+
+    def __init__(self, values):
+        intervals = {4: [], 6: []}
+        for value in values:
+            version, start, end = self.interval(value)
+            intervals[version].append((start, end))
+
+        self.starts = {}
+        self.ends = {}
+        for version, entries in intervals.items():
+            merged = []
+            for start, end in sorted(entries):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, _ in merged]
+            self.ends[version] = [end for _, end in merged]
+
+    @staticmethod
+    def interval(value):
+        """Return (version, first address, last address) for an IP or
+        CIDR range. Raises ValueError for other values."""
+        network = ipaddress.ip_network(value, strict=False)
+        return (
+            network.version,
+            int(network.network_address),
+            int(network.broadcast_address),
+        )
+
+    @classmethod
+    def is_valid(cls, value):
+        """Return True if value is an IP or a CIDR range."""
+        try:
+            cls.interval(value)
+        except ValueError:
+            return False
+        return True
+
+    def __contains__(self, value):
+        try:
+            version, start, end = self.interval(value)
+        except ValueError:
+            return False
+        i = bisect.bisect_right(self.starts[version], start) - 1
+        return i >= 0 and self.ends[version][i] >= end
+
+    def __len__(self):
+        """Number of addresses covered by the index."""
+        return sum(
+            end - start + 1
+            for version in self.starts
+            for start, end in zip(self.starts[version], self.ends[version])
+        )
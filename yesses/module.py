@@ -1,6 +1,22 @@
 from importlib import import_module
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import functools
+import hashlib
 import fnmatch
+import inspect
+import json
+import logging
 import re
+import threading
+
+from yesses.httpcache import cached_session
+from yesses.findingschannel import FindingsChannel
+from yesses.eventloop import get_event_loop, in_event_loop
+from yesses.utils import get_executor
+
+log = logging.getLogger("module")
 
 
 class YExample:
@@ -28,11 +44,45 @@ class YExample:
                 self.alerts = runner.config.alertslist.alerts
 
 
+class FindingsBuffer:
+    """Findings emitted by one worker. Buffers can be returned from
+    worker processes and added to the module's results with
+    YModule.emit_all().
+
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def emit(self, output_name, finding):
+        self.items.append((output_name, finding))
+
+    def __iter__(self):
+        return iter(self.items)
+
+
 class YModule:
+    # Modules that probe servers (and therefore need fresh responses)
+    # set this to False to bypass the run-wide HTTP response cache.
+    HTTP_CACHE = True
+    # Modules set this to True to fail the step if a task of a worker
+    # raises an exception (see worker_errors()); by default, the error
+    # is logged and the other tasks continue.
+    ABORT_ON_WORKER_ERRORS = False
+
     def __init__(self, step, **kwargs):
         self.step = step
+        if step is not None and step.http_cache is not None:
+            self.use_http_cache = step.http_cache
+        else:
+            self.use_http_cache = self.HTTP_CACHE
         self.__input_validation(kwargs)
         self.__create_result_dict()
+        self.__buffers = []
+        self.__buffers_lock = threading.Lock()
+        self.__local = threading.local()
+        self.__worker_errors = []
+        self.__checked = {}
 
     def __input_validation(self, kwargs):
         for field, properties in self.INPUTS.items():
@@ -56,6 +106,9 @@ class YModule:
             return
         if field not in kwargs or kwargs[field] is None:
             return
+        if isinstance(kwargs[field], FindingsChannel):
+            # streamed findings are checked as they arrive
+            return
         for el in kwargs[field]:
             if not isinstance(el, dict):
                 raise Exception(
@@ -109,16 +162,11 @@ class YModule:
         for result_field, findings in self.results.items():
             output_field, properties = self.find_matching_output_field(result_field)
             output_fields_found.append(output_field)
-            if properties["provided_keys"] is None:
-                continue
-            for el in findings:
-                for key in properties["provided_keys"]:
-                    try:
-                        el[key]
-                    except KeyError:
-                        raise Exception(
-                            f"In field {result_field}: Missing key '{key}' on output element '{el}' in {self.step}."
-                        )
+            # findings returned by run() as a generator were checked already
+            checked_list, checked = self.__checked.get(result_field, (None, 0))
+            if checked_list is not findings:
+                checked = 0
+            self.__check_output_elements(result_field, properties, findings[checked:])
 
         if set(output_fields_found) != set(self.OUTPUTS.keys()):
             missing = set(self.OUTPUTS.keys()) - set(output_fields_found)
@@ -127,6 +175,38 @@ class YModule:
                 f"Missing field(s) in output of {self.step}: {', '.join(missing)}"
             )
 
+    def __check_output_elements(self, result_field, properties, findings):
+        if properties["provided_keys"] is None:
+            return
+        for el in findings:
+            for key in properties["provided_keys"]:
+                try:
+                    el[key]
+                except KeyError:
+                    raise Exception(
+                        f"In field {result_field}: Missing key '{key}' on output element '{el}' in {self.step}."
+                    )
+
+    def add_result(self, output_name, finding):
+        """Check a finding yielded by run() and add it to the output
+        `output_name`. Unlike emit(), findings are added in the order
+        they are yielded and are not deduplicated, so that no further
+        copy of the findings is kept.
+
+        """
+        _, properties = self.find_matching_output_field(output_name)
+        results = self.results.setdefault(output_name, [])
+        checked_list, checked = self.__checked.get(output_name, (None, 0))
+        if checked_list is not results:
+            checked = 0
+        # findings that were added to self.results directly
+        self.__check_output_elements(output_name, properties, results[checked:])
+        self.__check_output_elements(output_name, properties, [finding])
+        results.append(finding)
+        self.__checked[output_name] = (results, len(results))
+        if self.step is not None:
+            self.step.publish(output_name, finding)
+
     @classmethod
     def selftest(cls, standalone=True):
         import logging
@@ -159,7 +239,169 @@ class YModule:
         )
         return name
 
+    def get_previous_results(self, output_name):
+        """Return the findings produced for `output_name` in the previous
+        run of this step, or None if they are not available.
+
+        """
+        if self.step is None:
+            return None
+        return self.step.get_previous_output(output_name)
+
+    def get_previous_input(self, input_name):
+        """Return the value of the input `input_name` in the previous run of
+        this step, or None if it is not available.
+
+        """
+        if self.step is None:
+            return None
+        return self.step.get_previous_input(input_name)
+
+    def http_session(self):
+        """Return a requests session for the requests of this module.
+        GET and HEAD requests are answered from the run-wide response
+        cache if the module (HTTP_CACHE) and the step (`http_cache`)
+        allow this.
+
+        """
+        return cached_session(self.use_http_cache)
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Call function(*args, **kwargs) in the thread pool of the
+        event loop and return its result, so that blocking calls (e.g.,
+        requests) in `async def run()` do not stop other coroutines.
+        The size of the pool limits the number of calls running at the
+        same time in the whole run.
+
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, context.run, functools.partial(function, *args, **kwargs)
+        )
+
+    def emit(self, output_name, finding):
+        """Add a finding to the output `output_name`. Can be called from
+        any thread: each thread writes to its own buffer. The buffers
+        are merged into self.results after run() (or when
+        merge_emitted() is called); duplicate findings are removed and
+        the emitted findings are sorted, so that the order does not
+        depend on the scheduling of the threads.
+
+        Findings are also passed on immediately to steps that consume
+        them while this step is running (see `stream`). When called
+        from a coroutine, this could block the event loop, so the
+        findings are passed on when run() has finished instead.
+
+        """
+        if self.step is not None and not in_event_loop():
+            self.step.publish(output_name, finding)
+        buffer = getattr(self.__local, "buffer", None)
+        if buffer is None:
+            buffer = FindingsBuffer()
+            self.__local.buffer = buffer
+            with self.__buffers_lock:
+                self.__buffers.append(buffer)
+        buffer.emit(output_name, finding)
+
+    def emit_all(self, buffer):
+        """Add the findings from a FindingsBuffer, e.g., returned from a
+        worker process."""
+        for output_name, finding in buffer:
+            self.emit(output_name, finding)
+
+    @staticmethod
+    def finding_digest(finding):
+        # a digest instead of the serialized finding, so that large
+        # findings (e.g., pages) are not kept a second time
+        return hashlib.sha256(
+            json.dumps(finding, sort_keys=True, default=str).encode()
+        ).digest()
+
+    def merge_emitted(self):
+        with self.__buffers_lock:
+            buffers = self.__buffers
+            self.__buffers = []
+            self.__local = threading.local()
+
+        emitted = {}
+        for buffer in buffers:
+            for output_name, finding in buffer:
+                key = self.finding_digest(finding)
+                emitted.setdefault(output_name, {}).setdefault(key, finding)
+
+        for output_name, findings in emitted.items():
+            results = self.results.setdefault(output_name, [])
+            existing = set(self.finding_digest(f) for f in results)
+            results += [
+                finding
+                for key, finding in sorted(findings.items())
+                if key not in existing
+            ]
+
+    @contextmanager
+    def worker_errors(self):
+        """Log exceptions raised within this context instead of letting
+        them end the worker. Use this around each task of a worker
+        thread, so that an error only affects this task. If
+        ABORT_ON_WORKER_ERRORS is set, the errors are raised after run()
+        has finished.
+
+        """
+        try:
+            yield
+        except Exception as e:
+            log.exception(f"Error in worker of {self.__class__.__name__}")
+            if self.ABORT_ON_WORKER_ERRORS:
+                self.__worker_errors.append(e)
+
+    def start_worker(self, target, *args):
+        """Start a thread running target(*args). Exceptions ending the
+        thread are handled as in worker_errors()."""
+
+        def run_worker():
+            with self.worker_errors():
+                target(*args)
+
+        # the thread belongs to the step (e.g., for its log)
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(run_worker,))
+        thread.start()
+        return thread
+
+    def thread_pool(self, max_workers):
+        """Return a ThreadPoolExecutor whose threads belong to the step
+        of this module, like those of start_worker()."""
+        return get_executor("threads", max_workers)
+
+    def __raise_worker_errors(self):
+        if not self.__worker_errors:
+            return
+        raise Exception(
+            f"{len(self.__worker_errors)} error(s) in workers of {self.step}, first error: {self.__worker_errors[0]!r}"
+        ) from self.__worker_errors[0]
+
     def run_module(self):
-        self.run()
+        """Run the module and return its findings by output name.
+
+        run() can add findings to self.results, call emit(), or be a
+        generator yielding (output_name, finding) pairs. Yielded
+        findings are checked one by one as they are produced and
+        passed on to streaming steps immediately (see add_result()).
+
+        run() can also be defined with `async def`, optionally yielding
+        findings as well. It then runs on the event loop shared by all
+        steps of the run (see EventLoop).
+
+        """
+        results = self.run()
+        if inspect.iscoroutine(results):
+            results = get_event_loop().run(results)
+        elif inspect.isasyncgen(results):
+            results = get_event_loop().iterate(results)
+        if inspect.isgenerator(results):
+            for output_name, finding in results:
+                self.add_result(output_name, finding)
+        self.__raise_worker_errors()
+        self.merge_emitted()
         self.__check_output_types()
         return self.results
@@ -0,0 +1,115 @@
+import contextvars
+import errno
+import ipaddress
+import logging
+import threading
+from contextlib import contextmanager
+
+from .cache import active_cache
+
+log = logging.getLogger("reachability")
+
+# set per step (and inherited by its worker threads), so that steps
+# running at the same time do not change each other's setting
+_retry = contextvars.ContextVar("retry_unreachable", default=False)
+
+
+class Unreachable(OSError):
+    """Raised instead of connecting to an IP and port that already failed
+    earlier in the run."""
+
+
+class ReachabilityCache:
+    """Remembers IPs and ports that could not be connected to so that
+    later steps fail fast instead of waiting for the same timeouts
+    again. Refused connections and unreachable networks or hosts are
+    recorded at once. Other errors, e.g., timeouts, may be transient;
+    they are only recorded after MAX_ERRORS failed connections in a row.
+
+    Failures are kept for the duration of the run. If the cache
+    setting `unreachable_ttl` is set, they are also stored in the
+    cache file and are valid for the given number of seconds in
+    subsequent runs.
+
+    A step can ignore the recorded failures by setting
+    `retry_unreachable: true`.
+
+    """
+
+    NAMESPACE = "unreachable"
+    MAX_ERRORS = 3
+    PERMANENT_ERRNOS = {errno.ECONNREFUSED, errno.ENETUNREACH, errno.EHOSTUNREACH}
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.ttl = cache.setting("unreachable_ttl")
+        self.failures = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(ip, port):
+        return f"{ip}:{port}"
+
+    @staticmethod
+    def is_ip(host):
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return True
+
+    def get_failure(self, ip, port):
+        key = self.key(ip, port)
+        with self.lock:
+            if key in self.failures:
+                return self.failures[key]
+        if self.ttl:
+            return self.cache.get(self.NAMESPACE, key)
+        return None
+
+    def check(self, ip, port):
+        """Raise Unreachable if connecting to the ip and port failed before."""
+        if _retry.get():
+            return
+        error = self.get_failure(ip, port)
+        if error is not None:
+            raise Unreachable(f"{ip} is not reachable on port {port}: {error}")
+
+    def record_failure(self, ip, port, error):
+        if isinstance(error, Unreachable) or not self.is_ip(ip):
+            return
+        key = self.key(ip, port)
+        permanent = error.errno in self.PERMANENT_ERRNOS
+        error = str(error) or error.__class__.__name__
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            if not permanent and self.errors[key] < self.MAX_ERRORS:
+                log.debug(f"Cannot connect to {ip} on port {port}: {error}")
+                return
+            self.failures[key] = error
+        log.debug(f"Recording {ip} on port {port} as unreachable: {error}")
+        if self.ttl:
+            self.cache.set(self.NAMESPACE, key, error, self.ttl)
+
+    def record_success(self, ip, port):
+        key = self.key(ip, port)
+        with self.lock:
+            self.failures.pop(key, None)
+            self.errors.pop(key, None)
+        if self.ttl:
+            self.cache.delete(self.NAMESPACE, key)
+
+    @contextmanager
+    def retrying(self, retry=True):
+        """Within this context (and in threads inheriting it), previously
+        recorded failures are ignored."""
+        token = _retry.set(retry)
+        try:
+            yield
+        finally:
+            _retry.reset(token)
+
+
+def get_reachability_cache():
+    return active_cache().shared("reachability", ReachabilityCache)
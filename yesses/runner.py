@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 
 import logging
+import threading
 from datetime import datetime, timedelta
 
 from yesses import Config
+from yesses.cache import activate
 
 log = logging.getLogger("run")
 
@@ -15,33 +17,98 @@ class Runner:
     def run(self, do_resume=False, repeat=None):
         log.info(f"Starting run. do_resume={do_resume}, repeat={repeat}")
         start = datetime.now()
-        if do_resume:
-            skip_to = self.config.load_resume()
-        if repeat is not None:
+        self.config.cache.load()
+        activate(self.config.cache)
+        try:
             if do_resume:
-                skip_to -= repeat
+                skip_to = self.config.load_resume()
+            if repeat is not None:
+                if do_resume:
+                    skip_to -= repeat
+                else:
+                    skip_to = len(self.config.steps) - repeat
+                if skip_to < 0:
+                    raise Exception(
+                        f"There are {len(self.config.steps)} steps, we were asked to resume from step {skip_to}. That does not work."
+                    )
+                self.config.load_resume(skip_to)
+
+            if do_resume or repeat is not None:
+                log.info(f"Resuming after step {skip_to}.")
+            steps = [
+                step
+                for step in self.config.steps
+                if not (do_resume or repeat is not None) or step.number > skip_to
+            ]
+            for group in self.group_steps(steps):
+                if len(group) == 1:
+                    self.run_step(group[0])
+                else:
+                    self.run_streaming(group)
+
+            end = datetime.now()
+            time = end - start
+
+            for output in self.config.outputs:
+                output.run(time)
+
+            self.config.save_persist()
+            log.info(f"Run finished in {time}s.")
+        except BaseException:
+            # keep the progress of the steps (e.g., the position in the
+            # certificate transparency log) for the next run
+            self.config.cache.save()
+            raise
+        finally:
+            # e.g., stop the event loop of asynchronous modules
+            self.config.cache.close()
+
+    @staticmethod
+    def group_steps(steps):
+        """Group each step with the following steps that have `stream:
+        true`; the steps of a group run at the same time."""
+        groups = []
+        for step in steps:
+            if step.stream and groups:
+                groups[-1].append(step)
             else:
-                skip_to = len(self.config.steps) - repeat
-            if skip_to < 0:
-                raise Exception(
-                    f"There are {len(self.config.steps)} steps, we were asked to resume from step {skip_to}. That does not work."
-                )
-            self.config.load_resume(skip_to)
-
-        if do_resume or repeat is not None:
-            log.info(f"Resuming after step {skip_to}.")
-        for step in self.config.steps:
-            if not (do_resume or repeat is not None) or step.number > skip_to:
-                log.info(f"Step: {step.action}")
-                step.load_findings(self.config.findingslist)
-                self.config.alertslist.collect(step.execute())
-                self.config.save_resume(step.number)
-
-        end = datetime.now()
-        time = end - start
-
-        for output in self.config.outputs:
-            output.run(time)
-
-        self.config.save_persist()
-        log.info(f"Run finished in {time}s.")
+                groups.append([step])
+        return groups
+
+    def run_step(self, step):
+        log.info(f"Step: {step.action}")
+        step.load_findings(self.config.findingslist)
+        self.config.alertslist.collect(step.execute())
+        self.config.save_resume(step.number)
+
+    def run_streaming(self, group):
+        """Run the steps of a group at the same time, passing findings
+        between them as they are produced. Afterwards, the findings and
+        alerts of each step are stored in the order of the steps, as if
+        the steps had run one after another.
+
+        """
+        log.info(f"Steps (streaming): {', '.join(step.action for step in group)}")
+        for i, step in enumerate(group):
+            step.load_findings(self.config.findingslist, group[:i])
+
+        errors = []
+
+        def run_action(step):
+            try:
+                step.run_action()
+            except Exception as e:
+                log.exception(f"Error in {step}")
+                errors.append(e)
+
+        threads = [threading.Thread(target=run_action, args=(step,)) for step in group]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        for step in group:
+            self.config.alertslist.collect(step.finish())
+            self.config.save_resume(step.number)
@@ -1,8 +1,9 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
 
 from dnssec_scanner import DNSSECScanner
 from yesses.module import YModule, YExample
+from yesses.utils import get_executor
+from yesses.trustcache import get_trust_cache
 
 log = logging.getLogger("scan/dnssec_scanner")
 logging.getLogger("dnssec_scanner").setLevel(logging.CRITICAL)
@@ -12,6 +13,18 @@ class Dnssec(YModule):
     """Use the DNSSEC Scanner Python package to check the DNSSEC configuration
     of domain names. The DNSSEC Scanner provides log, warning and error messages
     for the DNSSEC validation process.
+
+The scans run in threads by default. Since validating signatures is
+partly CPU-bound, `executor: processes` runs them in separate processes
+instead.
+
+The DNSKEY and DS records forming the chain of trust of each zone are
+fetched once and shared between all domains of the run; they are
+reused until their TTL or their signatures expire. With
+`persist_keys: true`, they are also stored in the cache file for
+subsequent runs (if the cache setting `persist` is enabled). Worker
+processes start with the records known when the step starts, but
+records they fetch are not shared with other processes.
     """
 
     INPUTS = {
@@ -25,6 +38,16 @@ class Dnssec(YModule):
             "description": "Number of parallel DNSSEC scan commands to run.",
             "default": 10,
         },
+        "executor": {
+            "required_keys": None,
+            "description": "Run the scans in `threads` or in `processes`.",
+            "default": "threads",
+        },
+        "persist_keys": {
+            "required_keys": None,
+            "description": "Store the DNSKEY and DS records in the cache file and reuse them in subsequent runs until they expire.",
+            "default": False,
+        },
     }
 
     OUTPUTS = {
@@ -68,28 +91,56 @@ class Dnssec(YModule):
     ]
 
     def run(self):
-        with ThreadPoolExecutor(max_workers=self.parallel_requests) as executor:
-            executor.map(self.scan_domain, self.domains)
+        with get_executor(self.executor, self.parallel_requests) as executor:
+            futures = [
+                executor.submit(scan_domain, domain, self.persist_keys)
+                for domain in self.domains
+            ]
+            for domain, future in zip(self.domains, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": str(e) or e.__class__.__name__}
+                self.add_results(domain, result)
+        trust_cache = get_trust_cache()
+        log.debug(
+            f"Chain of trust cache: {trust_cache.hits} hits, {trust_cache.misses} misses"
+        )
 
-    def scan_domain(self, domain: str):
-        log.info(f"Scan domain {domain}")
-        scanner = DNSSECScanner(domain)
-        try:
-            result = scanner.run_scan()
-        except Exception as e:
+    def add_results(self, domain, result):
+        if "error" in result:
             self.results["DNSSEC-Other-Error-Domains"].append(
-                {"domain": domain, "error": str(e)}
+                {"domain": domain, "error": result["error"]}
             )
             return
         self.results["DNSSEC-Logs-Domains"].append(
-            {"domain": domain, "logs": result.logs}
+            {"domain": domain, "logs": result["logs"]}
         )
         self.results["DNSSEC-Warnings-Domains"].append(
-            {"domain": domain, "warnings": result.warnings}
+            {"domain": domain, "warnings": result["warnings"]}
         )
         self.results["DNSSEC-Errors-Domains"].append(
-            {"domain": domain, "errors": result.errors}
+            {"domain": domain, "errors": result["errors"]}
         )
         self.results["DNSSEC-Summary-Domains"].append(
-            {"domain": domain, "status": result.state.value, "note": result.note}
+            {"domain": domain, "status": result["status"], "note": result["note"]}
         )
+
+
+def scan_domain(domain: str, persist_keys: bool) -> dict:
+    """Scan the domain and return the results as a dictionary. Runs in
+    the worker threads or processes."""
+    log.info(f"Scan domain {domain}")
+    scanner = DNSSECScanner(domain)
+    try:
+        with get_trust_cache().caching(persist_keys):
+            result = scanner.run_scan()
+    except Exception as e:
+        return {"error": str(e)}
+    return {
+        "logs": result.logs,
+        "warnings": result.warnings,
+        "errors": result.errors,
+        "status": result.state.value,
+        "note": result.note,
+    }
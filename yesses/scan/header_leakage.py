@@ -1,7 +1,8 @@
-import re
 import logging
 
 from yesses.module import YModule, YExample
+from yesses.headerrules import HeaderRuleSet
+from yesses.headers import Headers
 
 log = logging.getLogger("scan/header_leakage")
 
@@ -18,6 +19,7 @@ attribute is set.
         "pages": {
             "required_keys": ["url", "header"],
             "description": "Required. URLs with headers to search for information leakage.",
+            "streaming": True,
         },
     }
 
@@ -28,21 +30,17 @@ attribute is set.
         }
     }
 
+    LEAKING_HEADERS = [
+        {"header": "Server", "value": "[a-zA-Z_-]+/.*"},
+        {"header": "X-Powered-By"},
+        {"header": "X-AspNet-Version"},
+    ]
+
     def run(self):
+        rules = HeaderRuleSet(self.LEAKING_HEADERS)
         for page in self.pages:
-            for header_attr in page["header"]:
-                if re.match("^server: [a-zA-Z_-]+/.*", header_attr, re.IGNORECASE):
-                    log.debug(f"Found potential leakage: {header_attr}")
-                    self.results["Leakages"].append(
-                        {"url": page["url"], "header": header_attr}
-                    )
-                if re.match(r"x-powered-by: .*", header_attr, re.IGNORECASE):
-                    log.debug(f"Found potential leakage: {header_attr}")
-                    self.results["Leakages"].append(
-                        {"url": page["url"], "header": header_attr}
-                    )
-                if re.match(r"x-aspnet-version: .*", header_attr, re.IGNORECASE):
-                    log.debug(f"Found potential leakage: {header_attr}")
-                    self.results["Leakages"].append(
-                        {"url": page["url"], "header": header_attr}
-                    )
+            headers = Headers.from_lines(page["header"])
+            for _, header, value in rules.match(headers.merged()):
+                header_attr = f"{header}: {value}"
+                log.debug(f"Found potential leakage: {header_attr}")
+                yield "Leakages", {"url": page["url"], "header": header_attr}
@@ -1,4 +1,6 @@
 from typing import List
+import hashlib
+import json
 import re
 import logging
 from bs4 import BeautifulSoup
@@ -6,6 +8,7 @@ from comment_parser import comment_parser
 
 from yesses.module import YModule, YExample
 from yesses import utils
+from yesses.cache import active_cache
 
 log = logging.getLogger("scan/information_leakage")
 
@@ -36,6 +39,11 @@ name. All the regex expressions are searching only for strings that
 are either at the beginning or end of a line or which have whitespace
 before or after.
 
+Pages that did not change since the previous run are not searched
+again; the findings of the previous run are reused. This requires the
+cache setting `persist`, which is used to detect changes of the
+regular expressions and lists.
+
     """
 
     REGEX = {
@@ -47,6 +55,8 @@ before or after.
         "version-info": r"(^|\s|\()[a-zA-Z0-9-_.]*[Vv]ersion:?\s([0-9]+\.)+[0-9]+",
     }
 
+    CACHE_NAMESPACE = "information-leakage"
+
     DIR_LIST = "assets/information_leakage/common-directories.txt"
     FILE_ENDINGS_LIST = "assets/information_leakage/common-file-endings.txt"
 
@@ -54,6 +64,7 @@ before or after.
         "pages": {
             "required_keys": ["url", "data"],
             "description": "Required. Pages to search for information leakage.",
+            "streaming": True,
         },
         "search_regex": {
             "required_keys": ["type", "regex"],
@@ -117,19 +128,64 @@ before or after.
         for sr in self.search_regex:
             self.REGEX[sr["type"]] = sr["regex"]
 
+        # pages that did not change since the previous run are not searched
+        # again, the findings from the previous run are reused instead
+        previous_hashes, previous_leakages = self.get_previous_pages(
+            self.settings_digest(dir_list, file_endings_list)
+        )
+        unchanged_urls = set()
+
         for page in self.pages:
+            if (
+                page.get("validators")
+                and previous_hashes.get(page["url"]) == page["validators"]["hash"]
+            ):
+                unchanged_urls.add(page["url"])
+                continue
+
             soup = BeautifulSoup(page["data"], "html.parser")
 
             sess = InformationLeakageSession(soup, page, dir_list, file_endings_list)
 
             # search in CSS or JavaScript comments for information leakage
-            self.check_js_css_comments(sess)
+            yield from self.check_js_css_comments(sess)
 
             # search in the visible text for information leakages
-            self.check_visible_text(sess)
+            yield from self.check_visible_text(sess)
 
             # search in comments for information leakages
-            self.check_html_comments(sess)
+            yield from self.check_html_comments(sess)
+
+        log.debug(f"Reused findings for {len(unchanged_urls)} unchanged pages")
+        for leakage in previous_leakages:
+            if leakage["url"] in unchanged_urls:
+                yield "Leakages", leakage
+
+    def settings_digest(self, dir_list, file_endings_list):
+        settings = [self.REGEX, dir_list, file_endings_list]
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def get_previous_pages(self, settings):
+        """Return the hashes of the pages searched in the previous run
+        (by URL) and the findings of the previous run. Nothing is
+        returned if the settings were different in the previous run."""
+        cache = active_cache()
+        previous_settings = cache.get(self.CACHE_NAMESPACE, str(self.step))
+        cache.set(self.CACHE_NAMESPACE, str(self.step), settings)
+        if previous_settings != settings:
+            return {}, []
+
+        previous_leakages = self.get_previous_results("Leakages")
+        previous_pages = self.get_previous_input("pages")
+        if previous_leakages is None or previous_pages is None:
+            return {}, []
+
+        previous_hashes = {
+            page["url"]: page["validators"]["hash"]
+            for page in previous_pages
+            if page.get("validators")
+        }
+        return previous_hashes, previous_leakages
 
     def check_visible_text(self, sess: InformationLeakageSession):
         html = sess.soup.find_all("html")
@@ -139,7 +195,7 @@ before or after.
         for script in sess.soup(["script", "style"]):
             script.extract()
         text = sess.soup.get_text()
-        self.search_string(text, "visible_text", ["email"], sess)
+        yield from self.search_string(text, "visible_text", ["email"], sess)
 
     def check_html_comments(self, sess: InformationLeakageSession):
         html = sess.soup.find_all("html")
@@ -148,20 +204,22 @@ before or after.
 
         for script in sess.soup(["script", "style"]):
             script.extract()
-        self.search_comments(sess.soup.prettify(), "html_comment", "text/html", sess)
+        yield from self.search_comments(
+            sess.soup.prettify(), "html_comment", "text/html", sess
+        )
 
     def check_js_css_comments(self, sess: InformationLeakageSession):
         html = sess.soup.find_all("html")
         # if there is no html tag then it is most likely a css or js file
         if not html:
-            self.search_comments(
+            yield from self.search_comments(
                 sess.page["data"], "css_js_comment", "application/javascript", sess
             )
         else:
             # If there is an html tag then extract the script and style tags
             # and search them.
             for script in sess.soup(["script", "style"]):
-                self.search_comments(
+                yield from self.search_comments(
                     script.text, "css_js_comment", "application/javascript", sess
                 )
 
@@ -170,7 +228,7 @@ before or after.
     ):
         comments = comment_parser.extract_comments_from_str(text, mime)
         for comment in comments:
-            self.search_string(comment._text, type, [], sess)
+            yield from self.search_string(comment._text, type, [], sess)
 
     def search_string(
         self,
@@ -194,14 +252,12 @@ before or after.
                 log.debug(
                     f"URL: {sess.page['url']} Found: {found} Finding: {type} => {finding}"
                 )
-                self.results["Leakages"].append(
-                    {
-                        "url": sess.page["url"],
-                        "type": type,
-                        "found": found,
-                        "finding": finding,
-                    }
-                )
+                yield "Leakages", {
+                    "url": sess.page["url"],
+                    "type": type,
+                    "found": found,
+                    "finding": finding,
+                }
 
     @staticmethod
     def check_file_or_path(
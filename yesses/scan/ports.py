@@ -1,12 +1,31 @@
-import nmap
+import asyncio
+import ipaddress
 import logging
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
 from yesses.module import YModule, YExample
+from yesses.iprange import expand_ips, ip_sort_key
 
 log = logging.getLogger("scan/ports")
 
 
 class Ports(YModule):
     """Uses `nmap` to scan for open ports.
+
+The IPs are handed to nmap in batches of `batch_size` targets (IPv4
+and IPv6 addresses are scanned in separate batches). Up to
+`parallel_scans` nmap processes run at the same time. nmap's XML
+output is parsed while the scan is running, so results are collected
+as soon as nmap has finished a host.
+
+With `engine: connect`, nmap is not used. Instead, yesses tries to
+open TCP connections to each port (like nmap's `-sT`), with up to
+`parallel_connections` connection attempts at the same time, at most
+`connections_per_ip` per IP, and at most `connect_rate` new attempts
+per second to the same IP. Only TCP can be scanned with this
+engine. If `ports` is not set, nmap's 100 most common ports are
+scanned. The outputs are the same as for the nmap engine.
     """
 
     DEFAULT_PROTOCOL_ARGUMENTS = [
@@ -23,7 +42,7 @@ class Ports(YModule):
     INPUTS = {
         "ips": {
             "required_keys": ["ip"],
-            "description": "Required. IP range to scan (e.g., `use IPs`).",
+            "description": "Required. IP range to scan (e.g., `use IPs`). Entries can also be CIDR ranges (e.g., `192.0.2.0/24`).",
             "unwrap": True,
         },
         "protocols": {
@@ -46,6 +65,41 @@ class Ports(YModule):
             "description": "Command-line arguments to provide to nmap when scanning for a specific protocol.",
             "default": DEFAULT_PROTOCOL_ARGUMENTS,
         },
+        "batch_size": {
+            "required_keys": None,
+            "description": "Number of IPs to scan with one nmap process.",
+            "default": 64,
+        },
+        "parallel_scans": {
+            "required_keys": None,
+            "description": "Number of nmap processes to run in parallel.",
+            "default": 4,
+        },
+        "engine": {
+            "required_keys": None,
+            "description": "`nmap` to scan using nmap or `connect` to scan TCP ports without nmap (see description).",
+            "default": "nmap",
+        },
+        "parallel_connections": {
+            "required_keys": None,
+            "description": "Engine `connect`: Number of connection attempts to run in parallel.",
+            "default": 500,
+        },
+        "connections_per_ip": {
+            "required_keys": None,
+            "description": "Engine `connect`: Maximum number of parallel connection attempts to the same IP.",
+            "default": 10,
+        },
+        "connect_rate": {
+            "required_keys": None,
+            "description": "Engine `connect`: Maximum number of connection attempts per second to the same IP (0: no limit).",
+            "default": 50,
+        },
+        "connect_timeout": {
+            "required_keys": None,
+            "description": "Engine `connect`: Time in seconds after which a port is considered closed.",
+            "default": 3,
+        },
     }
 
     OUTPUTS = {
@@ -83,9 +137,34 @@ class Ports(YModule):
 
     default_arguments = ["-T4", "-n", "-Pn"]
 
+    # nmap's 100 most common TCP ports (`nmap -F`)
+    TOP_PORTS = (
+        "7,9,13,21-23,25-26,37,53,79-81,88,106,110-111,113,119,135,139,143-144,"
+        "179,199,389,427,443-445,465,513-515,543-544,548,554,587,631,646,873,990,"
+        "993,995,1025-1029,1110,1433,1720,1723,1755,1900,2000-2001,2049,2121,2717,"
+        "3000,3128,3306,3389,3986,4899,5000,5009,5051,5060,5101,5190,5357,5432,"
+        "5631,5666,5800,5900,6000-6001,6646,7070,8000,8008-8009,8080-8081,8443,"
+        "8888,9100,9999-10000,32768,49152-49157"
+    )
+
     def run(self):
-        for ip in self.ips:
-            self.results["Host-Ports"] += self.scan(ip)
+        if self.engine == "nmap":
+            with self.thread_pool(self.parallel_scans) as executor:
+                # consume the results to surface errors in the scans
+                list(executor.map(self.scan, self.batches()))
+        elif self.engine == "connect":
+            asyncio.run(self.connect_scan())
+        else:
+            raise Exception(f"Unknown engine for port scans: {self.engine}")
+
+        self.merge_emitted()
+        self.results["Host-Ports"].sort(
+            key=lambda x: (
+                ip_sort_key(x["ip"]),
+                self.protocols.index(x["protocol"]),
+                x["port"],
+            )
+        )
 
         known_ports = []
         for namedport in self.named_ports:
@@ -107,25 +186,175 @@ class Ports(YModule):
         )
         self.results["Other-Port-IPs"] = [{"ip": i} for i in iplist]
 
-    def scan(self, ip):
-        log.info(f"Scanning {ip}.")
+    @staticmethod
+    def is_ipv6(ip):
+        try:
+            return ipaddress.ip_address(ip).version == 6
+        except ValueError:
+            return ":" in ip  # poor man's IPv6 detection
+
+    def batches(self):
+        """Yield tuples (ipv6, targets) with at most batch_size targets,
+        each containing either IPv4 or IPv6 targets."""
+        groups = {False: [], True: []}
+        for ip in expand_ips(self.ips):
+            group = groups[self.is_ipv6(ip)]
+            group.append(ip)
+            if len(group) == self.batch_size:
+                yield self.is_ipv6(ip), list(group)
+                group.clear()
+        for ipv6, group in groups.items():
+            if group:
+                yield ipv6, group
+
+    def nmap_arguments(self, ipv6):
         args = [
-            pa["arguments"]
+            arg
             for pa in self.protocol_arguments
             if pa["protocol"] in self.protocols
+            for arg in pa["arguments"].split()
         ]
-        if ":" in ip:  # poor man's IPv6 detection
+        if ipv6:
             args.append("-6")
         args += self.default_arguments
+        if self.ports is not None:
+            args += ["-p", str(self.ports)]
+        return args
 
-        scanner = nmap.PortScanner()
-        scanner.scan(ip, self.ports, arguments=" ".join(args))
-        return [
-            {"ip": ip, "protocol": protocol, "port": port}
-            for protocol in self.protocols
-            for (port, data) in scanner[ip].get(protocol, {}).items()
-            if data["state"] == "open"
-        ]
+    def scan(self, batch):
+        ipv6, targets = batch
+        log.info(f"Scanning {len(targets)} IPs: {', '.join(targets)}.")
+
+        # nmap may report addresses in a different notation than the input
+        names = {self.normalize_ip(ip): ip for ip in targets}
+        command = ["nmap", "-oX", "-"] + self.nmap_arguments(ipv6) + targets
+
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=stderr
+            )
+            parse_error = None
+            try:
+                for _, element in ET.iterparse(process.stdout):
+                    if element.tag == "host":
+                        self.add_host(element, names)
+                        element.clear()
+            except ET.ParseError as e:
+                parse_error = e
+            finally:
+                process.stdout.close()
+                returncode = process.wait()
+
+            if returncode != 0:
+                stderr.seek(0)
+                raise Exception(
+                    f"nmap failed with exit code {returncode}: {stderr.read().decode(errors='replace')}"
+                )
+            if parse_error is not None:
+                raise Exception(f"Cannot parse output of nmap: {parse_error}")
+
+    @staticmethod
+    def normalize_ip(ip):
+        try:
+            return str(ipaddress.ip_address(ip))
+        except ValueError:
+            return ip
+
+    def add_host(self, element, names):
+        address = element.find("address[@addrtype='ipv4']")
+        if address is None:
+            address = element.find("address[@addrtype='ipv6']")
+        if address is None:
+            return
+        addr = address.get("addr")
+        ip = names.get(self.normalize_ip(addr), addr)
+
+        found = []
+        for port in element.iterfind("ports/port"):
+            state = port.find("state")
+            protocol = port.get("protocol")
+            if (
+                state is not None
+                and state.get("state") == "open"
+                and protocol in self.protocols
+            ):
+                found.append(
+                    {"ip": ip, "protocol": protocol, "port": int(port.get("portid"))}
+                )
+
+        log.debug(f"Found {len(found)} open ports on {ip}.")
+        for finding in found:
+            self.emit("Host-Ports", finding)
+
+    @staticmethod
+    def parse_ports(ports):
+        """Return the TCP ports from a port range in nmap notation."""
+        result = []
+        protocol = "T"
+        for part in str(ports).split(","):
+            part = part.strip()
+            if ":" in part:
+                protocol, part = part.split(":", 1)
+            if protocol.upper() != "T" or not part:
+                continue
+            if "-" in part:
+                start, end = part.split("-", 1)
+                result += range(int(start or 1), int(end or 65535) + 1)
+            else:
+                result.append(int(part))
+        return sorted(set(result))
+
+    async def connect_scan(self):
+        for protocol in self.protocols:
+            if protocol != "tcp":
+                log.warning(f"Engine connect cannot scan protocol {protocol}.")
+        if "tcp" not in self.protocols:
+            return
+
+        ports = self.parse_ports(self.TOP_PORTS if self.ports is None else self.ports)
+        log.info(f"Scanning {len(ports)} ports on {', '.join(self.ips)}.")
+
+        # port by port, so that parallel connections go to different IPs
+        targets = ((ip, port) for port in ports for ip in expand_ips(self.ips))
+        limits = {}
+        # earliest time of the next connection attempt to each IP
+        next_attempts = {}
+
+        async def wait_for_turn(ip):
+            if not self.connect_rate:
+                return
+            now = asyncio.get_running_loop().time()
+            start = max(now, next_attempts.get(ip, now))
+            next_attempts[ip] = start + 1 / self.connect_rate
+            await asyncio.sleep(start - now)
+
+        async def worker():
+            for ip, port in targets:
+                if ip not in limits:
+                    limits[ip] = asyncio.Semaphore(self.connections_per_ip)
+                async with limits[ip]:
+                    await wait_for_turn(ip)
+                    if await self.connect(ip, port):
+                        self.emit(
+                            "Host-Ports", {"ip": ip, "protocol": "tcp", "port": port}
+                        )
+
+        await asyncio.gather(*(worker() for _ in range(self.parallel_connections)))
+
+    async def connect(self, ip, port):
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port), self.connect_timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            # e.g., the connection was reset by the peer
+            pass
+        return True
 
 
 if __name__ == "__main__":
@@ -1,7 +1,14 @@
 from tlsprofiler import TLSProfiler
 from yesses.module import YModule, YExample
+from yesses.cache import active_cache
+from yesses.domaintrie import DomainTrie
+from yesses.utils import get_executor
+import hashlib
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import socket
+import ssl
+from cryptography import x509
+from cryptography.x509.oid import NameOID
 
 log = logging.getLogger("scan/tlssettings")
 
@@ -10,6 +17,20 @@ class TLSSettings(YModule):
     """Uses the sslyze library to scan a webserver's TLS configuration and
     compare it to the Mozilla TLS configuration profiles.
 
+Domains served by the same endpoint (IP address and port 443) with
+the same certificate are scanned only once if the certificate is
+valid for the domain names; the results are reported for each of the
+domains. Domains that are not covered by the certificate are scanned
+individually.
+
+If `cache_ttl` is set, the results for each endpoint and certificate
+are stored in the cache (see the `cache` section of the
+configuration) and reused in subsequent runs until they expire.
+
+The scans run in threads by default. Since parts of the scans are
+CPU-bound, `executor: processes` runs them in separate processes
+instead.
+
     """
 
     INPUTS = {
@@ -38,6 +59,16 @@ class TLSSettings(YModule):
             "description": "Number of parallel TLS scan commands to run.",
             "default": 10,
         },
+        "cache_ttl": {
+            "required_keys": None,
+            "description": "Time in seconds for which scan results for an endpoint and certificate are reused (0: do not reuse results).",
+            "default": 0,
+        },
+        "executor": {
+            "required_keys": None,
+            "description": "Run the scans in `threads` or in `processes`.",
+            "default": "threads",
+        },
     }
 
     OUTPUTS = {
@@ -88,59 +119,196 @@ class TLSSettings(YModule):
         )
     ]
 
+    CACHE_NAMESPACE = "tls"
+
     def run(self):
-        with ThreadPoolExecutor(max_workers=self.parallel_requests) as executor:
-            executor.map(self.scan_domain, self.domains)
+        # the certificates are fetched in threads, the handshakes are
+        # not CPU-bound
+        with self.thread_pool(self.parallel_requests) as executor:
+            endpoints = list(executor.map(get_endpoint, self.domains))
+        scans = self.group_domains(endpoints)
 
-    def scan_domain(self, domain):
-        scanner = TLSProfiler(
-            domain, ca_file=self.ca_file, cert_expire_warning=self.cert_expire_warning
-        )
-        if scanner.server_error is not None:
-            self.results["TLS-Other-Error-Domains"].append(
-                {
-                    "domain": domain,
-                    "error": scanner.server_error,
-                }
-            )
+        domain_results = {}
+        with get_executor(self.executor, self.parallel_requests) as executor:
+            futures = []
+            for domain, _, key in scans:
+                result = self.get_cached_result(key)
+                if result is None:
+                    result = executor.submit(
+                        scan_domain,
+                        domain,
+                        self.tls_profile,
+                        self.ca_file,
+                        self.cert_expire_warning,
+                    )
+                futures.append(result)
+
+            for (_, domains, key), future in zip(scans, futures):
+                if isinstance(future, dict):
+                    result = future
+                else:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"error": str(e) or e.__class__.__name__}
+                    self.cache_result(key, result)
+                for domain in domains:
+                    domain_results[domain] = result
+
+        for domain in self.domains:
+            self.add_results(domain, domain_results[domain])
+
+    def group_domains(self, endpoints):
+        """Return a list of scans (domain to scan, domains to report the
+        results for, endpoint key)."""
+        groups = {}
+        scans = []
+        for domain, (key, names) in zip(self.domains, endpoints):
+            if key is not None and names.matches(domain):
+                groups.setdefault(key, []).append(domain)
+            else:
+                scans.append((domain, [domain], None))
+
+        for key, domains in groups.items():
+            if len(domains) > 1:
+                log.info(f"Scanning {key} once for {', '.join(domains)}")
+            scans.append((domains[0], domains, key))
+        return scans
+
+    def cache_key(self, key):
+        return f"{key} {self.tls_profile} {self.ca_file} {self.cert_expire_warning}"
+
+    def get_cached_result(self, key):
+        if key is None or not self.cache_ttl:
+            return None
+        result = active_cache().get(self.CACHE_NAMESPACE, self.cache_key(key))
+        if result is not None:
+            log.info(f"Using cached results for {key}")
+        return result
+
+    def cache_result(self, key, result):
+        # errors are not cached, the server may be available in the next run
+        if key is None or not self.cache_ttl or "error" in result:
             return
-        try:
-            scanner.scan_server()
-            tls_results = scanner.compare_to_profile(self.tls_profile)
-        except Exception as e:
+        active_cache().set(
+            self.CACHE_NAMESPACE, self.cache_key(key), result, self.cache_ttl
+        )
+
+    def add_results(self, domain, result):
+        if "error" in result:
             self.results["TLS-Other-Error-Domains"].append(
                 {
                     "domain": domain,
-                    "error": str(e),
+                    "error": result["error"],
                 }
             )
             return
 
-        if tls_results.all_ok:
+        if result["all_ok"]:
             self.results["TLS-Okay-Domains"].append({"domain": domain})
 
-        if not tls_results.validated:
+        if not result["validated"]:
             self.results["TLS-Validation-Fail-Domains"].append(
-                {"domain": domain, "errors": tls_results.validation_errors}
+                {"domain": domain, "errors": result["validation_errors"]}
             )
 
-        if not tls_results.no_warnings:
+        if not result["no_warnings"]:
             self.results["TLS-Certificate-Warnings-Domains"].append(
-                {"domain": domain, "warnings": tls_results.cert_warnings}
+                {"domain": domain, "warnings": result["cert_warnings"]}
             )
 
-        if not tls_results.profile_matched:
+        if not result["profile_matched"]:
             self.results["TLS-Profile-Mismatch-Domains"].append(
                 {
                     "domain": domain,
-                    "errors": tls_results.profile_errors,
+                    "errors": result["profile_errors"],
                 }
             )
 
-        if tls_results.vulnerable:
+        if result["vulnerable"]:
             self.results["TLS-Vulnerability-Domains"].append(
                 {
                     "domain": domain,
-                    "errors": tls_results.vulnerability_errors,
+                    "errors": result["vulnerability_errors"],
                 }
             )
+
+
+PORT = 443
+TIMEOUT = 10
+
+
+def get_endpoint(domain):
+    """Connect to the domain and return the key identifying the endpoint
+    (IP, port, and certificate fingerprint) and the names the
+    certificate is valid for. Returns (None, None) if the certificate
+    cannot be retrieved.
+
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    # the certificate is needed even from servers with outdated
+    # configurations
+    context.minimum_version = ssl.TLSVersion.MINIMUM_SUPPORTED
+    try:
+        context.set_ciphers("ALL:@SECLEVEL=0")
+    except ssl.SSLError:
+        pass
+
+    try:
+        with socket.create_connection((domain, PORT), timeout=TIMEOUT) as sock:
+            ip = sock.getpeername()[0]
+            with context.wrap_socket(sock, server_hostname=domain) as tls:
+                der = tls.getpeercert(binary_form=True)
+    except (OSError, ValueError) as e:
+        log.debug(f"Cannot retrieve certificate for {domain}: {e}")
+        return None, None
+
+    fingerprint = hashlib.sha256(der).hexdigest()
+    return f"{ip}:{PORT} {fingerprint}", get_certificate_names(der)
+
+
+def get_certificate_names(der):
+    try:
+        certificate = x509.load_der_x509_certificate(der)
+    except ValueError:
+        return DomainTrie()
+    try:
+        extension = certificate.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName
+        )
+        return DomainTrie(extension.value.get_values_for_type(x509.DNSName))
+    except x509.ExtensionNotFound:
+        # fall back to the common name
+        return DomainTrie(
+            attribute.value
+            for attribute in certificate.subject.get_attributes_for_oid(
+                NameOID.COMMON_NAME
+            )
+        )
+
+
+def scan_domain(domain, tls_profile, ca_file, cert_expire_warning):
+    """Run the scan and return its results as a dictionary. Runs in the
+    worker threads or processes."""
+    scanner = TLSProfiler(domain, ca_file=ca_file, cert_expire_warning=cert_expire_warning)
+    if scanner.server_error is not None:
+        return {"error": scanner.server_error}
+    try:
+        scanner.scan_server()
+        tls_results = scanner.compare_to_profile(tls_profile)
+    except Exception as e:
+        return {"error": str(e)}
+
+    return {
+        "all_ok": tls_results.all_ok,
+        "validated": tls_results.validated,
+        "validation_errors": tls_results.validation_errors,
+        "no_warnings": tls_results.no_warnings,
+        "cert_warnings": tls_results.cert_warnings,
+        "profile_matched": tls_results.profile_matched,
+        "profile_errors": tls_results.profile_errors,
+        "vulnerable": tls_results.vulnerable,
+        "vulnerability_errors": tls_results.vulnerability_errors,
+    }
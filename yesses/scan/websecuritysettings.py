@@ -1,7 +1,9 @@
 import requests
 import logging
 from yesses.utils import force_ip_connection
-import re
+from yesses.headers import Headers
+from yesses.hostcontrol import get_host_controller
+from yesses.headerrules import HeaderRuleSet
 from yesses.module import YModule, YExample
 
 log = logging.getLogger("scan/websecuritysettings")
@@ -18,6 +20,19 @@ class WebSecuritySettings(YModule):
 
 Note: Only tests the web origins' root URLs.
 
+The header and cookie rules can also be applied to pages that other
+modules have already fetched (e.g., `Linked-Pages` from
+LinkedPaths), using the `pages` input. Pages are checked offline,
+i.e., without sending any requests, so this works for any number of
+pages. Redirections and methods are only checked for `origins`. The
+findings for pages have no IP.
+
+Origins are checked in parallel (see `parallel_requests`); all
+requests to an origin share one keep-alive connection. If the server
+answers an `OPTIONS` request with an `Allow` header, the disallowed
+methods are checked against that header instead of sending a request
+for each method.
+
 
 ##### Disallowed Headers #####
 Disallowed headers are configured using objects that define the header name, optionally a regular expression that is matched against the headers' value, and a human-readable reason that explains the rule.
@@ -34,11 +49,13 @@ Defines headers that must be present in all responses. The `reason` keyword is n
 
 If the `origin` keyword is present, the header is only required on origins that match the respective value (using `re.match`).
 
-If `value_expr` is present, the contents are evaluated using python3's `eval()` function. Useful variables are:
+If `value_expr` is present, the contents are evaluated as a python3 expression. Useful variables are:
 
   * `value`, which contains the header's contents as a string
   * `max_age`, which contains the `max_age` header property, e.g., for Strict-Transport-Security headers (if set)
 
+Expressions may only use literals, these variables, comparisons, boolean and arithmetic operators, the functions `len` and `int`, and methods of `value` (e.g., `value.startswith("enforce,")`).
+
 ##### Insecure Cookies #####
 
 Cookies are only considered "secure" if they have the following properties:
@@ -53,6 +70,10 @@ Cookies are only considered "secure" if they have the following properties:
 
     DISALLOWED_METHODS = ["TRACE", "TRACK", "CONNECT"]
 
+    TIMEOUT = 10
+    MAX_DRAIN_LENGTH = 65536
+    HTTP_CACHE = False
+
     DISALLOWED_HEADERS = [
         {"header": "Access-Control-.*", "reason": "CORS must be disabled",},
         {
@@ -84,6 +105,13 @@ Cookies are only considered "secure" if they have the following properties:
         "origins": {
             "required_keys": ["url", "domain", "ip"],
             "description": "List of web origins to scan.",
+            "default": [],
+        },
+        "pages": {
+            "required_keys": ["url", "header"],
+            "description": "Pages to check offline for disallowed and missing headers and insecure cookies (see description).",
+            "streaming": True,
+            "default": [],
         },
         "disallowed_methods": {
             "required_keys": None,
@@ -100,6 +128,11 @@ Cookies are only considered "secure" if they have the following properties:
             "description": "Objects defining headers that are required (see description).",
             "default": REQUIRED_HEADERS,
         },
+        "parallel_requests": {
+            "required_keys": None,
+            "description": "Number of origins to check in parallel.",
+            "default": 10,
+        },
     }
 
     OUTPUTS = {
@@ -146,34 +179,109 @@ Cookies are only considered "secure" if they have the following properties:
      - Disallowed-Method-URLs
      - Insecure-Cookie-URLs
 """,
-        )
+        ),
+        YExample(
+            "Check headers of crawled pages",
+            """
+ - scan Web Security Settings:
+     pages:
+       - url: https://example.com/login
+         header:
+           - 'Server: Apache/2.4.41 (Ubuntu) OpenSSL/1.1.1'
+           - 'Set-Cookie: session=1234; Path=/; Secure'
+   find:
+     - Disallowed-Header-URLs
+     - Missing-Header-URLs
+     - Insecure-Cookie-URLs
+""",
+        ),
     ]
 
     def run(self):
-        for origin in self.origins:
-            self.run_checks(**origin)
+        self.disallowed_rules = HeaderRuleSet(self.disallowed_headers)
+        self.required_rules = HeaderRuleSet(self.required_headers)
+        for page in self.pages:
+            self.check_headers(page["url"], None, Headers.from_lines(page["header"]))
+        with self.thread_pool(self.parallel_requests) as executor:
+            # consume the results to surface errors in the checks
+            list(executor.map(lambda origin: self.run_checks(**origin), self.origins))
 
     def run_checks(self, url, domain, ip):
         log.info(f"Now checking {domain} on IP {ip}")
-        with force_ip_connection(domain, ip):
+        with force_ip_connection(
+            domain, ip, thread_local=True
+        ), self.http_session() as session:
             try:
                 log.debug(f"GET {url} with IP {ip}")
-                response = requests.get(url, timeout=10, stream=True)
+                response = self.request(session, "GET", url, ip, stream=True)
             except requests.exceptions.RequestException as e:
                 log.debug(f"Exception {e} on {url}, ip={ip}")
             else:
                 if url.startswith("http://"):
                     self.check_http_settings(ip, response)
                 self.check_https_settings(ip, response)
-                response.close()
+                self.release(response)
+
+            self.check_disallowed_methods(session, url, ip)
+
+    def request(self, session, method, url, ip, **kwargs):
+        # exceptions within the context are counted as errors for this host
+        with get_host_controller().request(ip, self.TIMEOUT) as slot:
+            response = session.request(method, url, timeout=slot.timeout, **kwargs)
+            return slot.check(response)
 
-            self.check_disallowed_methods(url, ip)
+    def release(self, response):
+        """Return the connection of a streamed response to the pool. Small
+        bodies are read so that the connection can be reused for the
+        remaining requests; otherwise, the connection is closed."""
+        try:
+            length = int(response.headers.get("content-length", ""))
+        except ValueError:
+            length = None
+        if length is not None and length <= self.MAX_DRAIN_LENGTH:
+            try:
+                response.content
+            except requests.exceptions.RequestException:
+                pass
+        response.close()
+
+    def get_allowed_methods(self, session, url, ip):
+        """Return the methods listed in the Allow header of a response to
+        an OPTIONS request, or None if the server does not provide
+        this information."""
+        try:
+            response = self.request(session, "OPTIONS", url, ip)
+        except requests.exceptions.RequestException as e:
+            log.debug(f"Exception {e} on {url}, ip={ip}")
+            return None
+        if response.status_code >= 400 or "allow" not in response.headers:
+            return None
+        return set(
+            method.strip().upper() for method in response.headers["allow"].split(",")
+        )
+
+    def check_disallowed_methods(self, session, url, ip):
+        allowed_methods = self.get_allowed_methods(session, url, ip)
+        if allowed_methods is not None:
+            found_disallowed_methods = [
+                f"supports forbidden method {method} (according to Allow header)"
+                for method in self.disallowed_methods
+                if method.upper() in allowed_methods
+            ]
+        else:
+            found_disallowed_methods = self.probe_disallowed_methods(session, url, ip)
+
+        if found_disallowed_methods:
+            self.emit(
+                "Disallowed-Method-URLs",
+                {"url": url, "ip": ip, "errors": found_disallowed_methods,},
+            )
 
-    def check_disallowed_methods(self, url, ip):
+    def probe_disallowed_methods(self, session, url, ip):
         # check webserver's reaction to an illegal method first.
         status_code_on_error = None
         try:
-            response = requests.request("YESSES", url, timeout=10)
+            response = self.request(session, "YESSES", url, ip)
         except requests.exceptions.RequestException as e:
             log.debug(f"Exception {e} on {url}, ip={ip}")
         else:
@@ -183,7 +291,7 @@ Cookies are only considered "secure" if they have the following properties:
         for method in self.disallowed_methods:
             try:
                 log.debug(f"{method} {url} with IP {ip}")
-                response = requests.request(method, url, timeout=10)
+                response = self.request(session, method, url, ip)
             except requests.exceptions.RequestException as e:
                 log.debug(f"Exception {e} on {url}, ip={ip}")
             else:
@@ -198,15 +306,13 @@ Cookies are only considered "secure" if they have the following properties:
                             f"supports forbidden method {method}"
                         )
 
-        if found_disallowed_methods:
-            self.results["Disallowed-Method-URLs"].append(
-                {"url": url, "ip": ip, "errors": found_disallowed_methods,}
-            )
+        return found_disallowed_methods
 
     def check_http_settings(self, ip, response):
         if len(response.history) == 0:
-            self.results["Missing-HTTPS-Redirect-URLs"].append(
-                {"url": response.url, "ip": ip, "error": "no redirection encountered"}
+            self.emit(
+                "Missing-HTTPS-Redirect-URLs",
+                {"url": response.url, "ip": ip, "error": "no redirection encountered"},
             )
 
     def check_https_settings(self, ip, response):
@@ -214,36 +320,15 @@ Cookies are only considered "secure" if they have the following properties:
         for step_uri in chain[1:]:
             if not step_uri.startswith("https://"):
                 error = f"got redirections to non-HTTPS-URLs; redirection chain: {' → '.join(chain)}"
-                self.results["Redirect-to-non-HTTPS-URLs"].append(
-                    {"url": chain[0], "ip": ip, "error": error,}
+                self.emit(
+                    "Redirect-to-non-HTTPS-URLs",
+                    {"url": chain[0], "ip": ip, "error": error,},
                 )
                 break
 
-        self.check_headers(ip, response)
-
-    def match_header(self, url, rule, header, value):
-        header = header.strip()
-        value = value.strip()
-        if re.fullmatch(rule["header"], header, re.IGNORECASE):
-            if "value" in rule:
-                if re.fullmatch(rule["value"], value, re.IGNORECASE):
-                    return True
-                else:
-                    return False
-            elif "value_expr" in rule:
-                # check if max_age attribute is set
-                match = re.search("max-age=([0-9]+)", value, re.IGNORECASE)
-                if match:
-                    max_age = int(match.group(1))
-                else:
-                    max_age = 0
-                return eval(rule["value_expr"])
-            else:
-                return True
+        self.check_response_headers(response)
 
-        return None
-
-    def check_headers(self, ip, response):
+    def check_response_headers(self, response):
         try:
             actual_ip = response.raw._connection.sock.socket.getsockname()[0]
         except AttributeError:
@@ -252,84 +337,69 @@ Cookies are only considered "secure" if they have the following properties:
             except:
                 actual_ip = None
 
-        self.check_disallowed_headers(actual_ip, response)
-        self.check_missing_headers(actual_ip, response)
-        self.check_insecure_cookies(actual_ip, response)
+        self.check_headers(response.url, actual_ip, Headers.from_response(response))
+
+    def check_headers(self, url, ip, headers):
+        """Check the headers of a response for `url`. Does not send any
+        requests."""
+        self.check_disallowed_headers(url, ip, headers)
+        self.check_missing_headers(url, ip, headers)
+        self.check_insecure_cookies(url, ip, headers.cookies())
 
-    def check_disallowed_headers(self, actual_ip, response):
-        found_disallowed_headers = []
-        for rule in self.disallowed_headers:
-            for header, value in response.headers.items():
-                match = self.match_header(response.url, rule, header, value)
-                if match is True:
-                    found_disallowed_headers.append(
-                        f"illegal header {header} (with value {value}): {rule['reason']}"
-                    )
+    def check_disallowed_headers(self, url, ip, headers):
+        found_disallowed_headers = [
+            f"illegal header {header} (with value {value}): {rule.rule['reason']}"
+            for rule, header, value in self.disallowed_rules.match(headers.merged())
+        ]
 
         if found_disallowed_headers:
-            self.results["Disallowed-Header-URLs"].append(
-                {
-                    "url": response.url,
-                    "ip": actual_ip,
-                    "errors": found_disallowed_headers,
-                }
+            self.emit(
+                "Disallowed-Header-URLs",
+                {"url": url, "ip": ip, "errors": found_disallowed_headers},
             )
 
-    def check_missing_headers(self, actual_ip, response):
+    def check_missing_headers(self, url, ip, headers):
         found_missing_headers = []
-        for rule in self.required_headers:
-            if "origin" in rule:
-                if not re.match(rule["origin"], response.url):
-                    continue
-
-            for header, value in response.headers.items():
-                match = self.match_header(response.url, rule, header, value)
-                if match is True:
-                    break
+        for rule in self.required_rules.missing(headers.merged(), url):
+            if "value" in rule.rule:
+                text = f" with value '{rule.rule['value']}'"
+            elif "value_expr" in rule.rule:
+                text = f" matching expression '{rule.rule['value_expr']}'"
             else:
-                if "value" in rule:
-                    text = f" with value '{rule['value']}'"
-                elif "value_expr" in rule:
-                    text = f" matching expression '{rule['value_expr']}'"
-                else:
-                    text = ""
-                found_missing_headers.append(
-                    f"missing header: '{rule['header']}' {text}"
-                )
+                text = ""
+            found_missing_headers.append(
+                f"missing header: '{rule.rule['header']}' {text}"
+            )
 
         if found_missing_headers:
-            self.results["Missing-Header-URLs"].append(
-                {"url": response.url, "ip": actual_ip, "errors": found_missing_headers,}
+            self.emit(
+                "Missing-Header-URLs",
+                {"url": url, "ip": ip, "errors": found_missing_headers},
             )
 
-    def check_insecure_cookies(self, actual_ip, response):
-        # check cookie headers
+    def check_insecure_cookies(self, url, ip, cookies):
+        # cookies as (name, attributes) parsed from Set-Cookie headers
         found_insecure_cookies = []
-        for c in response.cookies:
+        for name, attributes in cookies:
             insecure = []
-            if response.url.startswith("https:"):
-                if not c.name.startswith("__Secure-") and not c.name.startswith(
-                    "__Host-"
-                ):
+            if url.startswith("https:"):
+                if not name.startswith("__Secure-") and not name.startswith("__Host-"):
                     insecure.append("missing __Secure- or __Host-Prefix")
-                if not c.secure:
+                if "secure" not in attributes:
                     insecure.append("missing secure attribute")
-                if not c.has_nonstandard_attr("SameSite"):
+                if "samesite" not in attributes:
                     insecure.append("missing SameSite attribute")
 
-            if not c.has_nonstandard_attr("HttpOnly"):
+            if "httponly" not in attributes:
                 insecure.append("missing HttpOnly attribute")
 
             if len(insecure):
                 found_insecure_cookies.append(
-                    f"insecure cookie {c.name}: {', '.join(insecure)}"
+                    f"insecure cookie {name}: {', '.join(insecure)}"
                 )
 
         if found_insecure_cookies:
-            self.results["Insecure-Cookie-URLs"].append(
-                {
-                    "url": response.url,
-                    "ip": actual_ip,
-                    "errors": found_insecure_cookies,
-                }
+            self.emit(
+                "Insecure-Cookie-URLs",
+                {"url": url, "ip": ip, "errors": found_insecure_cookies},
             )
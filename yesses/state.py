@@ -1,6 +1,7 @@
 import yaml
 from pathlib import Path
 import yesses.scan.tls_settings
+import yesses.headers
 
 
 class State:
@@ -1,11 +1,15 @@
 from .module import YModule
 from .findingslist import FindingsList
+from .findingschannel import FindingsChannel
 import yaml
+import contextvars
 import logging
+import threading
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from io import StringIO as StringBuffer
 from .parsers import FindParser, ExpectParser, UseParser
+from .reachability import get_reachability_cache
 from dataclasses import dataclass
 
 
@@ -45,6 +49,15 @@ class LiteralStepInput(StepInput):
     def resolve(self, _):
         return self.data
 
+    def resolve_previous(self, _):
+        return self.data
+
+    def uses_outputs_of(self, steps):
+        return False
+
+    def open_channel(self, findingslist, running_steps):
+        return None
+
 
 @dataclass
 class GlobalFindingsStepInput(StepInput):
@@ -72,6 +85,60 @@ class GlobalFindingsStepInput(StepInput):
                     all_entries.append(entry)
         return all_entries
 
+    def uses_outputs_of(self, steps):
+        return any(
+            output.alias in self.findingskeys
+            for step in steps
+            for output in step.outputs
+        )
+
+    def open_channel(self, findingslist, running_steps):
+        """If any of the keys is produced by one of the steps in
+        running_steps, return a FindingsChannel that provides the
+        findings for all keys while these steps run. Otherwise, return
+        None.
+
+        """
+        producers = {}
+        for step in running_steps:
+            for output in step.outputs:
+                if output.alias in self.findingskeys:
+                    producers[output.alias] = (step, output.name)
+        if not producers:
+            return None
+
+        initial = []
+        for key in self.findingskeys:
+            if key in producers:
+                continue
+            for entry in findingslist.get(key):
+                if not entry in initial:
+                    initial.append(entry)
+
+        producing_steps = set(step.number for step, _ in producers.values())
+        channel = FindingsChannel(initial, len(producing_steps), self.required_keys)
+        for step, output_name in producers.values():
+            step.add_channel(output_name, channel)
+        return channel
+
+    def resolve_previous(self, findingslist):
+        """Like resolve(), but for the findings stored in the previous run.
+        Returns None if none of the keys was stored in the previous
+        run.
+
+        """
+        all_entries = None
+        for key in self.findingskeys:
+            previous = findingslist.get_previous(key, None)
+            if previous is None:
+                continue
+            if all_entries is None:
+                all_entries = []
+            for entry in previous:
+                if not entry in all_entries:
+                    all_entries.append(entry)
+        return all_entries
+
 
 @dataclass
 class StepOutput:
@@ -82,23 +149,42 @@ class StepOutput:
 
 log = logging.getLogger("step")
 
+# the step whose module is running in the current thread (or task);
+# inherited by the worker threads of the module
+current_step = contextvars.ContextVar("current_step", default=None)
+
+# the steps whose log is captured at the moment (see Step.capture_log)
+_capturing_steps = []
+_capturing_lock = threading.Lock()
+
 
 class Step:
     LOG_FORMATTER = logging.Formatter()
     LOG_LEVEL = logging.DEBUG
-    RESERVED = ["find", "expect", "name"]
+    RESERVED = [
+        "find",
+        "expect",
+        "name",
+        "retry_unreachable",
+        "http_cache",
+        "stream",
+    ]
 
     def __init__(self, raw, number):
         self.raw = raw
         self.number = number
         self.parse_action()
         self.parse_name()
+        self.retry_unreachable = self.raw.get("retry_unreachable", False)
+        self.http_cache = self.raw.get("http_cache", None)
+        self.stream = self.raw.get("stream", False)
         self.parse_find()
         self.parse_expect()
         self.parse_inputs()
         self.log_buffer = StringBuffer()
         self.duration = timedelta(0)
         self.output_data = None
+        self.channels = {}
 
     def parse_action(self):
         """From the raw step description, find the key that describes the
@@ -207,14 +293,99 @@ class Step:
     def get_log(self):
         return self.log_buffer.getvalue()
 
-    def load_findings(self, findings):
+    def load_findings(self, findings, running_steps=()):
+        """Resolve the inputs of this step. Inputs that use findings of
+        the steps in running_steps, which run at the same time as this
+        step, are provided as FindingsChannel (see `stream`).
+
+        """
+        self.validate_streaming(running_steps)
         self.findings = findings
-        self.input_resolved = {
-            k: v.resolve(self.findings) for k, v in self.inputs.items()
-        }
+        self.input_resolved = {}
+        for name, input in self.inputs.items():
+            channel = input.open_channel(findings, running_steps)
+            if channel is None:
+                self.input_resolved[name] = input.resolve(self.findings)
+            else:
+                self.input_resolved[name] = channel
+
+    def validate_streaming(self, running_steps):
+        for name, input in self.inputs.items():
+            if not input.uses_outputs_of(running_steps):
+                continue
+            if not self.action_class.INPUTS[name].get("streaming", False):
+                raise Exception(
+                    f"Input '{name}' of {self} uses findings of a step running at the same time, but does not support streaming."
+                )
+
+    def add_channel(self, output_name, channel):
+        self.channels.setdefault(output_name, []).append(channel)
+
+    def publish(self, output_name, finding):
+        """Pass a finding of this step to the steps that consume it while
+        this step is running."""
+        for channel in self.channels.get(output_name, []):
+            channel.put(finding)
+
+    def get_previous_output(self, name):
+        """Return the findings that the output `name` of this step produced
+        in the previous run, or None if they are not known (e.g.,
+        because the output was not used in a find expression).
+
+        """
+        for output in self.outputs:
+            if output.name == name:
+                return self.findings.get_previous(output.alias, None)
+        return None
+
+    def get_previous_input(self, name):
+        """Return the input `name` as it would have been resolved in the
+        previous run, or None if it is not known.
+
+        """
+        if not name in self.inputs:
+            return None
+        return self.inputs[name].resolve_previous(self.findings)
 
     def execute(self):
-        temp_findings = self.call_class_from_action()
+        self.run_action()
+        yield from self.finish()
+
+    def run_action(self):
+        """Run the module of this step. Findings are added to the findings
+        list in finish()."""
+        try:
+            self.temp_findings = self.call_class_from_action()
+            # the channels skip findings that were already published
+            for output_name, channels in self.channels.items():
+                for finding in self.temp_findings[output_name]:
+                    for channel in channels:
+                        channel.put(finding)
+        finally:
+            for channel in self.streams():
+                channel.finish()
+            for input in self.input_resolved.values():
+                if isinstance(input, FindingsChannel):
+                    input.close()
+
+    def streams(self):
+        unique = []
+        for channels in self.channels.values():
+            for channel in channels:
+                if channel not in unique:
+                    unique.append(channel)
+        return unique
+
+    def finish(self):
+        temp_findings = self.temp_findings
+        del self.temp_findings
+        # channels cannot be serialized (e.g., in the resume state),
+        # keep the findings that were read from them instead
+        self.channels = {}
+        for name, input in self.input_resolved.items():
+            if isinstance(input, FindingsChannel):
+                self.input_resolved[name] = input.items
+
         log.info(
             f"{self.action} took {self.duration.total_seconds()}s and produced {len(self.get_log())} bytes of output."
         )
@@ -248,7 +419,9 @@ class Step:
                 f'Unable to initialize action "{self.action}": {str(e)}\n\n{self.get_definition()}'
             )
 
-        with self.capture_log():
+        with self.capture_log(), get_reachability_cache().retrying(
+            self.retry_unreachable
+        ):
             return obj.run_module()
 
     @contextmanager
@@ -256,16 +429,36 @@ class Step:
         log_handler = logging.StreamHandler(self.log_buffer)
         log_handler.setFormatter(self.LOG_FORMATTER)
         log_handler.setLevel(self.LOG_LEVEL)
+        log_handler.addFilter(self.owns_record)
         logger = logging.getLogger()
+        with _capturing_lock:
+            _capturing_steps.append(self)
         logger.addHandler(log_handler)
+        token = current_step.set(self)
         start = datetime.now()
         try:
             yield
         finally:
             end = datetime.now()
+            current_step.reset(token)
             logger.removeHandler(log_handler)
+            with _capturing_lock:
+                _capturing_steps.remove(self)
             self.duration += end - start
 
+    def owns_record(self, record):
+        """Whether a log record belongs to the log of this step. Records
+        of steps running at the same time are left out. Records from
+        threads that no step started (e.g., by libraries) can only be
+        attributed while this step is the only one running.
+
+        """
+        step = current_step.get()
+        if step is None:
+            with _capturing_lock:
+                return _capturing_steps == [self]
+        return step is self
+
     def has_verb(self, verb_name):
         return verb_name in self.raw
 
@@ -0,0 +1,144 @@
+import base64
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import dns.flags
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+
+from .cache import active_cache
+
+log = logging.getLogger("trustcache")
+
+
+class ChainOfTrustCache:
+    """Caches the DNSKEY and DS responses that make up the chain of
+    trust of DNSSEC-signed zones, so that the keys of a zone (and of
+    its parents up to the root) are fetched once for all domains
+    scanned, instead of once per domain.
+
+    Within caching(), queries for these record types sent with
+    dnspython's dns.query.udp() and dns.query.tcp() are answered from
+    the cache. dnssec_scanner does not accept a resolver, so these
+    functions are wrapped once for the whole process; the wrappers only
+    use the cache in the thread (or task) that entered caching(), so
+    that other steps running at the same time are not affected.
+
+    Responses are cached until their TTL or the earliest expiration of
+    their signatures (RRSIG), whichever comes first. Error responses
+    and responses without answer are not cached. The cache is shared
+    between all steps of a run. With `persist`, the responses are also
+    stored in the cache file and reused in subsequent runs.
+
+    """
+
+    NAMESPACE = "dnssec-keys"
+    RDTYPES = (dns.rdatatype.DNSKEY, dns.rdatatype.DS)
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def is_cacheable(cls, request):
+        return len(request.question) == 1 and request.question[0].rdtype in cls.RDTYPES
+
+    @staticmethod
+    def key(request, where):
+        question = request.question[0]
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+        dnssec = "+dnssec" if request.ednsflags & dns.flags.DO else ""
+        return f"{question.name} {rdtype} @{where}{dnssec}"
+
+    def lookup(self, request, where):
+        entry = self.cache.get(self.NAMESPACE, self.key(request, where))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = dns.message.from_wire(base64.b64decode(entry))
+        response.id = request.id
+        return response
+
+    def store(self, request, where, response, persist):
+        ttl = self.ttl(response)
+        if ttl is None or ttl <= 0:
+            return
+        self.cache.set(
+            self.NAMESPACE,
+            self.key(request, where),
+            base64.b64encode(response.to_wire()).decode(),
+            ttl,
+            transient=not persist,
+        )
+
+    @staticmethod
+    def ttl(response):
+        """Return the time for which the response can be cached, or None
+        if it must not be cached."""
+        if response.rcode() != dns.rcode.NOERROR or not response.answer:
+            return None
+        ttl = min(rrset.ttl for rrset in response.answer)
+        for rrset in response.answer:
+            if rrset.rdtype == dns.rdatatype.RRSIG:
+                for rrsig in rrset:
+                    ttl = min(ttl, rrsig.expiration - time.time())
+        return ttl
+
+    def query(self, query_function, persist, request, where, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return query_function(request, where, *args, **kwargs)
+        response = self.lookup(request, where)
+        if response is None:
+            response = query_function(request, where, *args, **kwargs)
+            self.store(request, where, response, persist)
+        return response
+
+    @contextmanager
+    def caching(self, persist=False):
+        """Answer the DNSKEY and DS queries of the current thread from the
+        cache within this context. With persist, the responses are
+        stored in the cache file."""
+        install_query_wrappers()
+        token = _caching.set((self, persist))
+        try:
+            yield self
+        finally:
+            _caching.reset(token)
+
+
+# the trust cache used by the current thread and whether its responses
+# are stored in the cache file (see ChainOfTrustCache.caching())
+_caching = contextvars.ContextVar("trust_cache", default=None)
+_install_lock = threading.Lock()
+
+
+def wrap_query(query_function):
+    def cached_query(request, where, *args, **kwargs):
+        caching = _caching.get()
+        if caching is None:
+            return query_function(request, where, *args, **kwargs)
+        trust_cache, persist = caching
+        return trust_cache.query(
+            query_function, persist, request, where, *args, **kwargs
+        )
+
+    cached_query.uncached = query_function
+    return cached_query
+
+
+def install_query_wrappers():
+    with _install_lock:
+        if not hasattr(dns.query.udp, "uncached"):
+            dns.query.udp = wrap_query(dns.query.udp)
+            dns.query.tcp = wrap_query(dns.query.tcp)
+
+
+def get_trust_cache():
+    return active_cache().shared("dnssec-keys", ChainOfTrustCache)
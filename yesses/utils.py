@@ -1,49 +1,110 @@
-from typing import List
+from typing import List, Optional, Tuple
+import contextvars
+import hashlib
 import re
 import requests
 import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from urllib.parse import urlparse
 
+import logging
 from urllib3.util import connection
 from contextlib import contextmanager
 
+from yesses.headers import Headers
+from yesses.reachability import get_reachability_cache
+from yesses.hostcontrol import get_host_controller
+
+log = logging.getLogger("utils")
+
 _orig_create_connection = connection.create_connection
 
+# Mappings from domain names to IPs that are used instead of the
+# system resolver; see force_ip_connection.
+_forced_ips = {}
+_thread_forced_ips = threading.local()
+
+
+def get_forced_ip(host):
+    thread_mapping = getattr(_thread_forced_ips, "mapping", {})
+    return thread_mapping.get(host, _forced_ips.get(host, host))
+
+
+def _patched_create_connection(address, *args, **kwargs):
+    """Wrap urllib3's create_connection to resolve the name elsewhere"""
+    # resolve hostname to an ip address; use your own
+    # resolver here, as otherwise the system resolver will be used.
+    host, port = address
+    ip = get_forced_ip(host)
+    # fail fast if the IP was not reachable earlier in the run
+    reachability = get_reachability_cache()
+    reachability.check(ip, port)
+    try:
+        sock = _orig_create_connection((ip, port), *args, **kwargs)
+    except OSError as e:
+        reachability.record_failure(ip, port, e)
+        raise
+    reachability.record_success(ip, port)
+    return sock
+
+
+connection.create_connection = _patched_create_connection
+
 
 @contextmanager
-def force_ip_connection(domain, ip):
-    def patched_create_connection(address, *args, **kwargs):
-        """Wrap urllib3's create_connection to resolve the name elsewhere"""
-        # resolve hostname to an ip address; use your own
-        # resolver here, as otherwise the system resolver will be used.
-        host, port = address
-        if host == domain:
-            hostname = ip
-        else:
-            hostname = host
-        return _orig_create_connection((hostname, port), *args, **kwargs)
+def force_ip_connection(domain, ip, thread_local=False):
+    """Connect to `ip` for all requests to `domain` within this context.
 
-    connection.create_connection = patched_create_connection
-    yield
-    connection.create_connection = _orig_create_connection
+    By default, the mapping applies to all threads (e.g., worker
+    threads started within the context). With thread_local=True, it
+    only applies to the current thread, which allows different
+    threads to connect to different IPs for the same domain.
+
+    """
+    if thread_local:
+        if not hasattr(_thread_forced_ips, "mapping"):
+            _thread_forced_ips.mapping = {}
+        mapping = _thread_forced_ips.mapping
+    else:
+        mapping = _forced_ips
+
+    previous = mapping.get(domain)
+    mapping[domain] = ip
+    try:
+        yield
+    finally:
+        if previous is None:
+            del mapping[domain]
+        else:
+            mapping[domain] = previous
 
 
 def clean_expression(expr):
     return re.sub(r"""\s+""", " ", expr).strip()
 
 
-def filter_origins(origins: list) -> dict:
+def filter_origins(origins: list, session: Optional[requests.Session] = None) -> dict:
     """
     Removes duplicated origins. First some origins are reachable through IPv4 and IPv6
     and second some web servers just redirect to another origin.
     :param origins:
+    :param session: session to use for the requests (optional)
     :return: origins without any duplication
     """
     filtered_origins = dict()
     for origin in origins:
         parsed_url = UrlParser(origin["url"])
-        with force_ip_connection(origin["domain"], origin["ip"]):
-            r = requests.get(parsed_url.origin)
+        with force_ip_connection(
+            origin["domain"], origin["ip"]
+        ), get_host_controller().request(origin["ip"]) as slot:
+            try:
+                r = slot.check(
+                    (session or requests).get(parsed_url.origin, timeout=slot.timeout)
+                )
+            except requests.exceptions.RequestException as e:
+                slot.fail()
+                log.warning(f"Skipping origin {parsed_url.origin}: {e}")
+                continue
             forwarded_parsed_url = UrlParser(r.url)
             if forwarded_parsed_url.origin not in filtered_origins.keys():
                 url = f"{forwarded_parsed_url.origin}/"
@@ -58,11 +119,45 @@ def filter_origins(origins: list) -> dict:
 def request_is_text(r: requests.Response) -> bool:
     if "content-type" not in r.headers:
         return False
-    if re.search(r"(^text/.*|^image/svg\+xml$)", r.headers["content-type"]):
+    return is_text_content_type(r.headers["content-type"])
+
+
+def page_is_text(page: dict) -> bool:
+    content_type = Headers.from_lines(page["header"]).get("content-type")
+    if content_type is None:
+        return False
+    return is_text_content_type(content_type)
+
+
+def is_text_content_type(content_type: str) -> bool:
+    if re.search(r"(^text/.*|^image/svg\+xml$)", content_type):
         return True
     return False
 
 
+def get_executor(kind: str, max_workers: int) -> Executor:
+    """Return an executor running tasks in threads (`threads`) or in
+    separate processes (`processes`). Functions and arguments passed to
+    a process executor must be picklable. Threads run in the context of
+    the caller (e.g., the step they belong to, see Step.capture_log())."""
+    if kind == "threads":
+        return ThreadPoolExecutor(
+            max_workers=max_workers,
+            initializer=inherit_context,
+            initargs=(contextvars.copy_context(),),
+        )
+    if kind == "processes":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    raise Exception(f"Unknown executor {kind}; use threads or processes.")
+
+
+def inherit_context(context: contextvars.Context):
+    """Set the context variables of the current thread to the values in
+    `context`, e.g., in a worker thread started by a step."""
+    for var, value in context.items():
+        var.set(value)
+
+
 def read_file(list: str) -> List[str]:
     with open(list) as file:
         dir_list = file.readlines()
@@ -70,11 +165,99 @@ def read_file(list: str) -> List[str]:
     return dir_list
 
 
-def convert_header(r: requests.Response) -> List[str]:
-    response = []
-    for key, value in r.headers.items():
-        response.append(f"{key}: {value}")
-    return response
+def convert_header(r: requests.Response) -> Headers:
+    """
+    Returns the headers of the response as a Headers object, which
+    behaves like the list of "Key: Value" strings used before.
+    :param r:
+    :return: the headers
+    """
+    return Headers.from_response(r)
+
+
+def page_validators(r: requests.Response) -> dict:
+    """
+    Returns the values needed to decide in a later run whether a page
+    changed: the ETag and Last-Modified headers (for conditional
+    requests) and a hash of the body.
+    :param r:
+    :return: validators to store with the page
+    """
+    return {
+        "etag": r.headers.get("etag"),
+        "last_modified": r.headers.get("last-modified"),
+        "hash": hashlib.sha256(r.content).hexdigest(),
+    }
+
+
+def page_from_response(url: str, r: requests.Response) -> dict:
+    return {
+        "url": url,
+        "header": convert_header(r),
+        "data": r.text,
+        "validators": page_validators(r),
+    }
+
+
+class Revalidator:
+    """Sends conditional requests (If-None-Match, If-Modified-Since) for
+    pages that were stored in the previous run. If the server answers
+    with 304 Not Modified, the stored page is returned instead of
+    downloading it again. The headers of the 304 response (e.g., Date)
+    replace the stored headers of the same name.
+
+    """
+
+    def __init__(self, previous_pages: Optional[List[dict]], enabled: bool = True):
+        self.pages = {}
+        if enabled and previous_pages:
+            for page in previous_pages:
+                if page.get("validators"):
+                    self.pages[page["url"]] = page
+
+    def conditional_headers(self, url: str) -> dict:
+        previous = self.pages.get(url)
+        if previous is None:
+            return {}
+        headers = {}
+        if previous["validators"]["etag"]:
+            headers["If-None-Match"] = previous["validators"]["etag"]
+        if previous["validators"]["last_modified"]:
+            headers["If-Modified-Since"] = previous["validators"]["last_modified"]
+        return headers
+
+    def get(
+        self, req_sess: requests.Session, url: str, **kwargs
+    ) -> Tuple[requests.Response, Optional[dict]]:
+        """
+        Requests the url, conditionally if possible.
+        :param req_sess:
+        :param url:
+        :return: the response and the stored page if the page was not modified, otherwise None
+        """
+        headers = kwargs.pop("headers", {})
+        conditional = self.conditional_headers(url)
+        if not conditional:
+            return req_sess.get(url, headers=headers, **kwargs), None
+
+        r = req_sess.get(url, headers={**headers, **conditional}, **kwargs)
+        if r.status_code != 304:
+            return r, None
+
+        stored = self.pages.get(UrlParser(r.url).full_url())
+        if stored is None:
+            # we have been redirected to a page that we did not store
+            return req_sess.get(url, headers=headers, **kwargs), None
+        return r, self.updated_page(stored, r)
+
+    @staticmethod
+    def updated_page(stored: dict, r: requests.Response) -> dict:
+        headers = Headers.from_lines(stored["header"]).updated(convert_header(r))
+        validators = dict(stored["validators"])
+        for name, header in (("etag", "etag"), ("last_modified", "last-modified")):
+            if r.headers.get(header):
+                validators[name] = r.headers[header]
+        return {**stored, "header": headers, "validators": validators}
 
 
 class UrlParser:
@@ -158,6 +341,15 @@ class ConcurrentSession:
         self._finished[ident] = False
         self._lock.release()
 
+    def add_new(self, items: list, item) -> bool:
+        """Append item to items unless it is contained already. Returns
+        True if the item was added."""
+        with self._lock:
+            if item in items:
+                return False
+            items.append(item)
+            return True
+
     def is_ready(self) -> bool:
         for value in self._finished.values():
             if not value: